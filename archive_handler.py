@@ -0,0 +1,25 @@
+import json
+from src.database_service import setup_database, close_idle_conversations, archive_old_partitions
+
+# Initialize outside the handler for reuse ("cold start" optimization)
+setup_database()
+
+def handler(event, context):
+    """
+    This Lambda is the archival entry point. It is meant to run on a schedule
+    (e.g. a daily EventBridge rule). It closes conversations that have gone
+    idle and moves message partitions past the retention period into the
+    cold storage table, keeping the hot 'messages' table small.
+    """
+    print("--- Archival Lambda Triggered ---")
+
+    closed = close_idle_conversations()
+    print(f"✅ Closed {closed} idle conversation(s).")
+
+    archived = archive_old_partitions()
+    print(f"✅ Archived {len(archived)} message partition(s): {', '.join(archived) or 'none'}.")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'closed_conversations': closed, 'archived_partitions': archived})
+    }
@@ -0,0 +1,31 @@
+# Run from the repository root before building the image: python build_knowledge_base.py
+import os
+from llama_index.core import Settings
+from llama_index.embeddings.gemini import GeminiEmbedding
+from src.knowledge_base import KNOWLEDGE_BASES, PREBUILT_MEMMAP_PATH, build_memmap_store
+
+def build_all():
+    """
+    Embeds every knowledge base into a memmap store under PREBUILT_MEMMAP_PATH.
+
+    The stores are copied into the image with the application code, so
+    containers on the memmap backend open them straight away instead of
+    embedding the documents through Gemini on every cold start. Delete the
+    folder and run this again whenever a knowledge base file changes.
+    """
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("❌ GOOGLE_API_KEY is not set. It is needed to embed the documents.")
+        return
+
+    # must match the embedding model the agent queries with (see src/graph.py)
+    Settings.embed_model = GeminiEmbedding(model_name="models/embedding-001")
+
+    for name, config in KNOWLEDGE_BASES.items():
+        persist_dir = os.path.join(PREBUILT_MEMMAP_PATH, config["collection"])
+        count = build_memmap_store(name, persist_dir)
+        print(f"📦 '{name}': {count} chunk(s) in {persist_dir}.")
+
+    print("➡️ Next step: build the image with VECTOR_STORE_BACKEND=memmap set on the functions.")
+
+if __name__ == "__main__":
+    build_all()
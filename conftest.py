@@ -0,0 +1 @@
+# Lets the tests import the application modules as "src.<module>" from the repository root.
@@ -1,7 +1,6 @@
 import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from src.credentials_service import seed_token_cache, get_token_cache
 
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -35,6 +34,9 @@ def generate_new_token():
     # Save the new credentials to the token.json file
     with open(NEW_TOKEN_FILE, "w") as token_file:
         token_file.write(creds.to_json())
+
+    # share the fresh access token with the deployed agent so it doesn't refresh it again straight away
+    seed_token_cache(creds, get_token_cache())
     
     print(f"\n✅ Success! New credentials saved to '{NEW_TOKEN_FILE}'.")
     print("➡️ Next step: Copy the contents of this file into AWS Secrets Manager.")
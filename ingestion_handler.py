@@ -3,6 +3,7 @@ import boto3
 import os
 from src.gmail_service import get_gmail_service, get_latest_email
 from src.database_service import setup_database, save_message
+from src.coalescing import COALESCE_WINDOW_SECONDS
 
 # Initialize outside the handler for reuse ("cold start" optimization)
 setup_database()
@@ -39,7 +40,7 @@ def handler(event, context):
             user_email = email_data["sender"]
 
             # 1. Save the user's new message to the database
-            save_message(thread_id, user_email, "user", user_question)
+            save_message(thread_id, user_email, "user", user_question, gmail_message_id=email_data["id"])
             print(f"✅ Message for thread {thread_id} saved to RDS.")
 
             # 2. Create a job message for the main agent
@@ -49,11 +50,16 @@ def handler(event, context):
                 "original_email": email_data
             }
 
-            # 3. Send the job to the SQS queue
-            sqs_client.send_message(
-                QueueUrl=NEW_QUERY_QUEUE_URL,
-                MessageBody=json.dumps(message_body)
-            )
+            # 3. Send the job to the SQS queue. FIFO queues group jobs by thread so a
+            # burst is delivered together; standard queues hold the job for the
+            # coalescing window so follow-ups can land before it is processed.
+            send_args = {"QueueUrl": NEW_QUERY_QUEUE_URL, "MessageBody": json.dumps(message_body)}
+            if NEW_QUERY_QUEUE_URL.endswith(".fifo"):
+                send_args["MessageGroupId"] = thread_id
+                send_args["MessageDeduplicationId"] = email_data["id"]
+            else:
+                send_args["DelaySeconds"] = min(COALESCE_WINDOW_SECONDS, 900)
+            sqs_client.send_message(**send_args)
             print(f"✅ Job for thread {thread_id} sent to SQS.")
             
             # Acknowledge the push notification
@@ -1,57 +1,64 @@
 import json
+import math
+import boto3
 from src.graph import build_graph
 from src.gmail_service import get_gmail_service
-from src.database_service import setup_database, get_conversation_history, save_message
+from src.database_service import setup_database
+from src.coalescing import latest_job_per_thread, ThreadStillActive
+from src.checkpoint_service import get_checkpointer, prune_checkpoints
+from src.job_processor import process_job
 
 # --- Global Setup ---
 print("Lambda container starting up.")
 setup_database()
 gmail_service = get_gmail_service()
-app = build_graph(gmail_service=gmail_service)
+checkpointer = get_checkpointer()
+prune_checkpoints(checkpointer)
+app = build_graph(gmail_service=gmail_service, checkpointer=checkpointer)
+sqs_client = boto3.client('sqs')
 print("LangGraph workflow compiled and ready.")
 
+def _queue_url(event_source_arn):
+    """Turns an SQS queue ARN (arn:aws:sqs:region:account:name) into its queue URL."""
+    _, _, _, region, account, name = event_source_arn.split(":")
+    return f"https://sqs.{region}.amazonaws.com/{account}/{name}"
+
 def handler(event, context):
     """
     This is the main entry point for the Lambda function.
     It is triggered by messages from the SQS queue.
+
+    A job whose thread is still inside its coalescing window is not waited
+    on, since the Lambda is billed while it sleeps. Its message is hidden for
+    the rest of the window and reported as a batch item failure, so SQS
+    delivers it again once the thread has gone quiet. This relies on the
+    event source mapping having ReportBatchItemFailures enabled.
     """
     print(f"Received {len(event['Records'])} message(s) from SQS.")
-    
+
+    # The message body from the ingestion Lambda will be a JSON string
+    records, jobs = [], []
     for record in event['Records']:
         try:
-            # The message body from the ingestion Lambda will be a JSON string
-            message_body = json.loads(record['body'])
-            thread_id = message_body['thread_id']
-            user_question = message_body['user_question']
-            original_email = message_body['original_email']
-
-            print(f"--- Processing Thread ID: {thread_id} ---")
-
-            # 1. Fetch the complete conversation history from the database
-            chat_history = get_conversation_history(thread_id)
-
-            # 2. Prepare the input for the LangGraph application
-            inputs = {
-                "question": user_question,
-                "original_email": original_email,
-                "chat_history": chat_history
-            }
-            
-            print("\n--- Invoking Agent Workflow ---")
-            final_state = None
-            final_state = app.invoke(inputs)
-            
-            # 3. Save the agent's final response if it was approved
-            if final_state:
-                manager_decision = final_state.get("final_decision", {})
-                if manager_decision.get("decision") == "send":
-                    agent_reply = final_state.get("drafted_answer")
-                    if agent_reply:
-                        save_message(thread_id, original_email['sender'], "agent", agent_reply)
-                        print("✅ Agent's reply saved to database.")
-
-            print("\n--- Workflow Complete ---")
+            jobs.append(json.loads(record['body']))
+            records.append(record)
+        except json.JSONDecodeError as e:
+            print(f"❌ Skipping malformed message: {e}")
 
+    # Only the newest job per thread in this batch needs to run
+    deferred = []
+    for message_body in latest_job_per_thread(jobs):
+        record = next(record for record, job in zip(records, jobs) if job is message_body)
+        try:
+            process_job(app, message_body, checkpointer, hold=False)
+        except ThreadStillActive as e:
+            print(f"⏳ {e} Deferring the job.")
+            sqs_client.change_message_visibility(
+                QueueUrl=_queue_url(record['eventSourceARN']),
+                ReceiptHandle=record['receiptHandle'],
+                VisibilityTimeout=math.ceil(e.retry_after),
+            )
+            deferred.append({"itemIdentifier": record['messageId']})
         except Exception as e:
             print(f"❌ An error occurred processing a message: {e}")
             # In a production system, move this message to a Dead-Letter Queue (DLQ)
@@ -59,5 +66,6 @@ def handler(event, context):
             
     return {
         'statusCode': 200,
-        'body': json.dumps('Processing complete.')
+        'body': json.dumps('Processing complete.'),
+        'batchItemFailures': deferred
     }
@@ -1,6 +1,8 @@
-from llama_index.core import Settings
-from llama_index.core.prompts import PromptTemplate
 from llama_index.core.retrievers import VectorIndexRetriever
+from src.llm_calls import complete_with_deadline, DeadlineExceeded
+from src.prompt_assembly import assemble_context, select_supporting_chunks, DEFAULT_CONTEXT_BUDGETS
+from src.knowledge_base import resolve_knowledge_base, cosine_similarity
+from src.prompt_templates import build_split_prompt, reference_library_chunks
 
 def extract_first_name(sender: str) -> str:
     """
@@ -28,7 +30,7 @@ def extract_first_name(sender: str) -> str:
         # takes the part before the '@' and then before the first '.'
         return sender.split('@')[0].split('.')[0]
 
-def customer_agent_node(state, index):
+def customer_agent_node(state, index=None, index_cache=None, deadline=None, router=None, prompt_cache=None, context_budget=DEFAULT_CONTEXT_BUDGETS["customer_agent"]):
     """
     Drafts a customer service response using a retrieval-augmented generation (RAG) pipeline.
 
@@ -40,12 +42,27 @@ def customer_agent_node(state, index):
     Args:
         state (GraphState): The current state of the graph. This function reads the
                             'question' and 'original_email' keys.
-        index (VectorStoreIndex): The LlamaIndex vector store containing the
-                                  knowledge base for retrieval.
+        index (VectorStoreIndex, optional): A fixed LlamaIndex vector store to
+                                            retrieve from for every email.
+        index_cache (IndexCache, optional): Used when no fixed index is given, to
+                                            load the knowledge base the email
+                                            resolves to.
+        deadline (float, optional): Seconds to wait for the LLM before giving up.
+        router (ModelRouter, optional): Picks the model for the call, using the
+                                        retrieval scores. Settings.llm is used if None.
+        prompt_cache (PromptCache, optional): The provider-side prompt cache. When
+                                              the routed model will cache it,
+                                              frequently retrieved chunks (within
+                                              context_budget) are moved into the
+                                              cached prompt prefix.
+        context_budget (int): Maximum number of tokens of retrieved context to
+                              place in the prompt.
 
     Returns:
-        Dict[str, Any]: A dictionary with the 'context_str' and 'drafted_answer'
-                        to be merged back into the graph's state.
+        Dict[str, Any]: A dictionary with the 'knowledge_base' used, the
+                        'context_str', 'drafted_answer', 'context_chunks' the
+                        draft was based on and the 'retrieval_scores', to be
+                        merged back into the graph's state.
     """
     print("--- DRAFTING ANSWER ---")
     question = state["question"]
@@ -67,28 +84,81 @@ def customer_agent_node(state, index):
             "drafted_answer": "I was unable to find a definitive answer due to a system error."
         }
 
+    # pick the knowledge base for this email unless a fixed index was provided.
+    knowledge_base = "fixed"
+    if index is None:
+        knowledge_base = resolve_knowledge_base(state["original_email"])
+        index = index_cache.get(knowledge_base)
+        print(f"📚 Answering from knowledge base '{knowledge_base}'.")
+
     # fetch relevant documents from the knowledge base (vector index).
-    qa_template = PromptTemplate(template_str)
     retriever = VectorIndexRetriever(index=index, similarity_top_k=2)
     retrieved_nodes = retriever.retrieve(question)
-    context_str = "\n\n".join([node.get_content() for node in retrieved_nodes])
+    # the routing and grounding thresholds are cosine similarities, whatever the backend
+    retrieval_scores = [cosine_similarity(node.score) for node in retrieved_nodes]
+
+    # drop overlapping chunks and trim the rest to this node's token budget.
+    context_chunks = assemble_context([node.get_content() for node in retrieved_nodes], context_budget)
+    context_str = "\n\n".join(context_chunks)
 
     # manually format the prompt with all the necessary variables (context,
-    # question, and personalized name). This gives us full control over the
+    # question, and personalized name). The static instructions come first so
+    # they can be cached by the provider. This gives us full control over the
     # final input to the LLM.
-    final_prompt = qa_template.format(
+    routing_state = {**state, "retrieval_scores": retrieval_scores}
+    final_prompt = build_split_prompt(
+        template_str,
         context_str=context_str,
         query_str=question,
         user_first_name=first_name
     )
+
+    # frequently retrieved chunks can live in the cached prompt prefix, so the
+    # variable part of the prompt only needs to point at them. That only pays
+    # off if the routed model will actually cache the prefix, so otherwise the
+    # plain prompt is sent, and it is also the fallback if caching fails.
+    if prompt_cache and router:
+        prompt_cache.hot_chunks.record(knowledge_base, context_chunks)
+        library_chunks = prompt_cache.hot_chunks.hot_chunks(knowledge_base, max_tokens=context_budget)
+        if library_chunks:
+            library_prompt = build_split_prompt(
+                template_str,
+                library_chunks=library_chunks,
+                fallback=final_prompt,
+                context_str="\n\n".join(reference_library_chunks(context_chunks, library_chunks)),
+                query_str=question,
+                user_first_name=first_name
+            )
+            if prompt_cache.will_cache(router.model_for("customer_agent", routing_state), library_prompt.prefix):
+                final_prompt = library_prompt
     
     # call the LLM directly with the fully constructed prompt to get the answer.
-    response = Settings.llm.complete(final_prompt)
+    route = "default"
+    try:
+        if router:
+            route, response = router.complete(final_prompt, "customer_agent", routing_state, deadline=deadline)
+        else:
+            response = complete_with_deadline(final_prompt, "customer_agent", deadline=deadline)
+    except DeadlineExceeded:
+        return {
+            "knowledge_base": knowledge_base,
+            "context_str": context_str,
+            "drafted_answer": "",
+            "context_chunks": context_chunks,
+            "retrieval_scores": retrieval_scores,
+            "deadline_exceeded": "customer_agent",
+            "model_routes": {"customer_agent": "timeout"}
+        }
     drafted_answer = str(response)
     print(f"✅ Drafted Answer:\n{drafted_answer}")
 
-    # Return the new information to be added to the graph's state.
+    # Return the new information to be added to the graph's state. Only the
+    # chunks the draft actually relied on are kept for the manager's review.
     return {
+        "knowledge_base": knowledge_base,
         "context_str": context_str,
-        "drafted_answer": drafted_answer
+        "drafted_answer": drafted_answer,
+        "context_chunks": select_supporting_chunks(context_chunks, drafted_answer),
+        "retrieval_scores": retrieval_scores,
+        "model_routes": {"customer_agent": route}
     }
\ No newline at end of file
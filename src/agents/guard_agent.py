@@ -1,6 +1,7 @@
 import json
-from llama_index.core import PromptTemplate, Settings
+from llama_index.core import PromptTemplate
 from pydantic import BaseModel, Field
+from src.llm_calls import complete_with_deadline, DeadlineExceeded
 
 class GuardrailDecision(BaseModel):
     """
@@ -10,12 +11,15 @@ class GuardrailDecision(BaseModel):
     Attributes:
         is_safe (bool): True if the input is deemed safe, False otherwise.
         reason (str): An explanation for the decision, especially if not safe.
+        complexity (str): "simple" for short, single-fact questions, "complex"
+                          otherwise. Used to route later nodes to a lighter model.
     """
     is_safe: bool = Field(description="True if the input is safe, otherwise False.")
     reason: str = Field(description="A brief explanation if the input is flagged as not safe.")
+    complexity: str = Field(default="complex", description="'simple' or 'complex'.")
 
 
-def guardrail_node(state):
+def guardrail_node(state, deadline=None, hedge=False, router=None):
     """
     Acts as a security checkpoint to vet the user's question for malicious content.
 
@@ -26,6 +30,10 @@ def guardrail_node(state):
     Args:
         state (GraphState): The current state of the graph. This function
                             reads the 'question' key.
+        deadline (float, optional): Seconds to wait for the LLM before giving up.
+        hedge (bool): Whether to fire a hedged request for slow LLM calls.
+        router (ModelRouter, optional): Picks the model for the call. Settings.llm
+                                        is used if None.
 
     Returns:
         Dict[str, Any]: A dictionary containing the 'guardrail_decision', which is an
@@ -46,23 +54,32 @@ def guardrail_node(state):
         decision = GuardrailDecision(is_safe=False, reason="System Error: Guardrail prompt file not found.")
         return {"guardrail_decision": decision}
 
-    # prompt template
+    # prompt template. Its static part is far below Gemini's minimum cacheable size, so it is sent uncached.
     prompt = PromptTemplate(GUARDRAIL_PROMPT).format(question=question)
 
     # LLM evaluates the prompt and returns its decision in JSON format.
-    response = Settings.llm.complete(prompt)
+    route = "default"
+    try:
+        if router:
+            route, response = router.complete(prompt, "guardrail", state, deadline=deadline, hedge=hedge)
+        else:
+            response = complete_with_deadline(prompt, "guardrail", deadline=deadline, hedge=hedge)
+    except DeadlineExceeded as e:
+        # a guardrail that cannot answer in time cannot vouch for the input.
+        decision = GuardrailDecision(is_safe=False, reason=f"Deadline exceeded: {e}")
+        return {"guardrail_decision": decision, "deadline_exceeded": "guardrail", "model_routes": {"guardrail": "timeout"}}
     print(f"Guardrail raw response: {response}")
     
     # safely parse the LLM's string response into the structured Pydantic model.
     try:
         decision_json = json.loads(str(response))
         decision = GuardrailDecision(**decision_json)
-        print(f"✅ Guardrail Decision: Is Safe? {decision.is_safe}, Reason: {decision.reason}")
-        return {"guardrail_decision": decision}
+        print(f"✅ Guardrail Decision: Is Safe? {decision.is_safe}, Reason: {decision.reason}, Complexity: {decision.complexity}")
+        return {"guardrail_decision": decision, "model_routes": {"guardrail": route}}
     
     except (json.JSONDecodeError, TypeError) as e:
         # if the LLM returns malformed JSON or unexpected data, default to flagging
         # the input as not safe to prevent potential security bypasses.
         print(f"❌ Guardrail failed to generate valid JSON: {e}. Defaulting to not safe.")
         decision = GuardrailDecision(is_safe=False, reason="Invalid format from guardrail model.")
-        return {"guardrail_decision": decision}
+        return {"guardrail_decision": decision, "model_routes": {"guardrail": route}}
@@ -1,7 +1,9 @@
 import json
-from llama_index.core import PromptTemplate, Settings
+from llama_index.core import PromptTemplate
+from src.llm_calls import complete_with_deadline, DeadlineExceeded
+from src.prompt_assembly import assemble_context, DEFAULT_CONTEXT_BUDGETS
 
-def manager_agent_node(state):
+def manager_agent_node(state, deadline=None, hedge=False, router=None, context_budget=DEFAULT_CONTEXT_BUDGETS["manager_agent"]):
     """
     Reviews the AI-drafted answer and decides on the next step.
 
@@ -12,7 +14,14 @@ def manager_agent_node(state):
 
     Args:
         state (GraphState): The current state of the graph. This function reads
-                            'question', 'context_str', and 'drafted_answer'.
+                            'question', 'context_chunks' (falling back to
+                            'context_str'), 'chat_history' and 'drafted_answer'.
+        deadline (float, optional): Seconds to wait for the LLM before giving up.
+        hedge (bool): Whether to fire a hedged request for slow LLM calls.
+        router (ModelRouter, optional): Picks the model for the call. Settings.llm
+                                        is used if None.
+        context_budget (int): Maximum number of tokens of retrieved context to
+                              place in the prompt.
 
     Returns:
         Dict[str, Any]: A dictionary containing the 'final_decision' from the manager.
@@ -31,22 +40,36 @@ def manager_agent_node(state):
         decision = {"decision": "escalate", "reason": "System Error: Manager prompt not found."}
         return {"final_decision": decision}
 
-    # loading the prompt template and question
+    # only the chunks the draft relied on are reviewed, trimmed to this node's budget.
+    context_chunks = state.get("context_chunks") or [state["context_str"]]
+    context_str = "\n\n".join(assemble_context(context_chunks, context_budget))
+
+    # loading the prompt template and question. Its static part is far below Gemini's
+    # minimum cacheable size, so it is sent uncached.
     prompt = PromptTemplate(MANAGER_AGENT_PROMPT).format(
         question=state["question"],
-        context_str=state["context_str"],
+        chat_history=state.get("chat_history", ""),
+        context_str=context_str,
         drafted_answer=state["drafted_answer"]
     )
 
     # the LLM acts as the manager, returning its decision in a JSON format.
-    response = Settings.llm.complete(prompt)
+    route = "default"
+    try:
+        if router:
+            route, response = router.complete(prompt, "manager_agent", state, deadline=deadline, hedge=hedge)
+        else:
+            response = complete_with_deadline(prompt, "manager_agent", deadline=deadline, hedge=hedge)
+    except DeadlineExceeded as e:
+        decision = {"decision": "escalate", "reason": f"Deadline exceeded: {e}"}
+        return {"final_decision": decision, "deadline_exceeded": "manager_agent", "model_routes": {"manager_agent": "timeout"}}
     print(f"Manager raw response: {response}")
 
     # safely parse the LLM's JSON response.
     try:
         decision_json = json.loads(str(response))
         print(f"✅ Manager Decision: {decision_json}")
-        return {"final_decision": decision_json}
+        return {"final_decision": decision_json, "model_routes": {"manager_agent": route}}
     
     except json.JSONDecodeError as e:
         
@@ -54,4 +77,4 @@ def manager_agent_node(state):
         # the output, so we escalate as a fallback.
         print(f"❌ Manager failed to generate valid JSON: {e}. Defaulting to escalate.")
         decision = {"decision": "escalate", "reason": "Invalid format from manager model."}
-        return {"final_decision": decision}
+        return {"final_decision": decision, "model_routes": {"manager_agent": route}}
@@ -0,0 +1,103 @@
+import os
+import uuid
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
+from langgraph.checkpoint.postgres import PostgresSaver
+from src.database_service import DB_NAME, DB_USER, DB_HOST, DB_PORT, get_db_password
+
+# checkpoints of runs that never finished are removed after this many days.
+CHECKPOINT_RETENTION_DAYS = int(os.getenv("CHECKPOINT_RETENTION_DAYS", "3"))
+# how long a cold start waits for the first checkpoint connection.
+CHECKPOINT_CONNECT_TIMEOUT_SECONDS = 10
+
+
+def get_checkpointer(max_connections=1):
+    """
+    Creates a LangGraph checkpointer backed by the application's Postgres database.
+
+    Connections come from a small pool that checks each one before handing it
+    out, so a connection dropped while the container sat idle (by RDS or a
+    proxy) is replaced instead of failing every later job.
+
+    The checkpoint tables are created on first use. Returns None if the database
+    is not configured or cannot be reached, in which case the graph simply runs
+    without checkpointing.
+
+    Args:
+        max_connections (int): The pool size, e.g. the worker's concurrency.
+    """
+    if not all([DB_NAME, DB_USER, DB_HOST, DB_PORT]):
+        print("❌ Database environment variables are not fully configured. Checkpointing disabled.")
+        return None
+
+    pool = ConnectionPool(
+        kwargs={
+            "dbname": DB_NAME,
+            "user": DB_USER,
+            "password": get_db_password(),
+            "host": DB_HOST,
+            "port": DB_PORT,
+            "autocommit": True,
+            "prepare_threshold": 0,
+            "row_factory": dict_row,
+        },
+        min_size=1,
+        max_size=max(1, max_connections),
+        check=ConnectionPool.check_connection,
+        open=True,
+    )
+    try:
+        pool.wait(timeout=CHECKPOINT_CONNECT_TIMEOUT_SECONDS)
+    except PoolTimeout as e:
+        print(f"❌ Could not connect to the database for checkpointing: {e}")
+        pool.close()
+        return None
+
+    checkpointer = PostgresSaver(pool)
+    checkpointer.setup()
+    print("✅ Postgres checkpointer ready.")
+    return checkpointer
+
+
+def checkpoint_config(thread_id, message_id):
+    """
+    Builds the LangGraph config that identifies one run of the graph.
+
+    Runs are keyed by the email thread and the Gmail message being answered, so a
+    redelivered SQS job maps back onto the same checkpoints. A job without a
+    message id gets a key of its own, so it cannot share checkpoints with
+    other such jobs (it just cannot be resumed after a redelivery).
+    """
+    if not message_id:
+        print(f"⚠️ Job for thread {thread_id} has no message id. Its run cannot be resumed.")
+        message_id = f"unkeyed-{uuid.uuid4().hex}"
+    return {"configurable": {"thread_id": f"{thread_id}:{message_id}"}}
+
+
+def prune_checkpoints(checkpointer, retention_days=CHECKPOINT_RETENTION_DAYS):
+    """
+    Deletes all checkpoints of runs whose latest checkpoint is older than the retention period.
+
+    Finished runs delete their own checkpoints, so this only has to clean up
+    after runs that were abandoned part-way through.
+    """
+    if not checkpointer:
+        return
+
+    with checkpointer.conn.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS stale_checkpoint_threads AS
+            SELECT thread_id FROM checkpoints
+            GROUP BY thread_id
+            HAVING MAX((checkpoint->>'ts')::timestamptz) < NOW() - make_interval(days => %s);
+            """,
+            (retention_days,)
+        )
+        for table in ("checkpoint_writes", "checkpoint_blobs", "checkpoints"):
+            cur.execute(f"DELETE FROM {table} WHERE thread_id IN (SELECT thread_id FROM stale_checkpoint_threads);")
+        cur.execute("SELECT COUNT(*) AS pruned FROM stale_checkpoint_threads;")
+        pruned = cur.fetchone()["pruned"]
+        cur.execute("DROP TABLE stale_checkpoint_threads;")
+
+    print(f"🧹 Pruned checkpoints for {pruned} abandoned run(s).")
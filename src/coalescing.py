@@ -0,0 +1,95 @@
+import os
+import time
+from datetime import datetime, timezone
+from src.database_service import get_pending_user_messages
+
+# how long a thread must be quiet before its pending messages are answered.
+COALESCE_WINDOW_SECONDS = int(os.getenv("COALESCE_WINDOW_SECONDS", "20"))
+
+
+class ThreadStillActive(Exception):
+    """Raised instead of waiting when a thread is still inside its coalescing window."""
+
+    def __init__(self, thread_id, retry_after):
+        super().__init__(f"Thread {thread_id} is still active. Retry in {retry_after:.1f}s.")
+        self.thread_id = thread_id
+        self.retry_after = retry_after
+
+
+def latest_job_per_thread(jobs):
+    """
+    Collapses a batch of jobs so that only the newest job for each thread remains.
+
+    SQS can deliver several jobs for the same thread in one batch (always in
+    order for FIFO message groups). The newest job is the one that will answer
+    the whole burst, so the older ones can be dropped before any work is done.
+
+    Args:
+        jobs (list): Parsed job message bodies, in delivery order.
+
+    Returns:
+        list: One job per thread_id, in order of each thread's last job.
+    """
+    latest = {}
+    for job in jobs:
+        latest.pop(job["thread_id"], None)
+        latest[job["thread_id"]] = job
+    skipped = len(jobs) - len(latest)
+    if skipped:
+        print(f"🧹 Coalesced {skipped} job(s) into a newer job for the same thread.")
+    return list(latest.values())
+
+
+def coalesce_thread(thread_id, gmail_message_id, fallback_question, hold=True):
+    """
+    Merges all unanswered user messages in a thread into a single question.
+
+    Only the job for the newest pending message answers the thread; jobs for
+    older messages return None so the burst costs one graph run instead of N.
+    If the newest message arrived less than COALESCE_WINDOW_SECONDS ago, this
+    waits out the rest of the window in case another follow-up is on its way.
+    Callers billed for idle time (the Lambda) pass hold=False and defer the
+    job themselves instead.
+
+    Args:
+        thread_id (str): The Gmail thread the job belongs to.
+        gmail_message_id (str): The Gmail message that created the job.
+        fallback_question (str): The job's own question, used when the
+                                 database cannot be reached.
+        hold (bool): Whether to sleep through the rest of the window.
+
+    Returns:
+        tuple | None: The merged question to answer and the message_ids of the
+                      user messages it covers, or None if a newer job in the
+                      same thread will answer it instead.
+
+    Raises:
+        ThreadStillActive: If hold is False and the window has not passed yet.
+    """
+    while True:
+        pending = get_pending_user_messages(thread_id)
+        if pending is None:
+            # no database: answer the job as it was received.
+            return fallback_question, []
+        if not pending:
+            # a redelivered job whose thread has already been answered.
+            print(f"⏭️ No unanswered messages left in thread {thread_id}. Skipping this job.")
+            return None
+
+        _, latest_id, _, latest_at = pending[-1]
+        if gmail_message_id and latest_id and latest_id != gmail_message_id:
+            print(f"⏭️ Newer message {latest_id} pending in thread {thread_id}. Skipping this job.")
+            return None
+
+        quiet_for = (datetime.now(timezone.utc) - latest_at).total_seconds()
+        if quiet_for >= COALESCE_WINDOW_SECONDS:
+            break
+        if not hold:
+            raise ThreadStillActive(thread_id, COALESCE_WINDOW_SECONDS - quiet_for)
+        print(f"⏳ Thread {thread_id} is still active. Holding for {COALESCE_WINDOW_SECONDS - quiet_for:.1f}s.")
+        time.sleep(COALESCE_WINDOW_SECONDS - quiet_for)
+
+    if len(pending) > 1:
+        print(f"🧵 Merging {len(pending)} pending messages in thread {thread_id} into one question.")
+    question = "\n\n".join(content for _, _, content, _ in pending)
+    return question, [message_id for message_id, _, _, _ in pending]
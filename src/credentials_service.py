@@ -0,0 +1,271 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows; see FileTokenCache
+    fcntl = None
+
+# cached access tokens are refreshed this long before they expire.
+REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+# where access tokens are shared: "postgres" across all containers, or "file"
+# on the local machine (admin scripts, tests).
+TOKEN_CACHE_BACKEND = os.getenv("TOKEN_CACHE_BACKEND", "postgres")
+TOKEN_CACHE_FILE = os.getenv("TOKEN_CACHE_FILE", "/tmp/oauth_token_cache.json")
+
+
+def _cache_key(refresh_token):
+    """The refresh token identifies the grant; only a hash of it is used as the cache key."""
+    return "gmail:" + hashlib.sha256(refresh_token.encode()).hexdigest()[:32]
+
+
+class PostgresTokenCache:
+    """
+    Shares access tokens between containers through the application database.
+
+    Refreshes are serialised with a transaction-level advisory lock, so when
+    several cold containers find an expired token only the first refreshes it
+    and the rest pick up its result.
+    """
+
+    def __init__(self):
+        # imported here so local scripts using the file cache do not need database secrets
+        from src.database_service import get_db_connection
+        self._connect = get_db_connection
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database unavailable for the token cache.")
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS oauth_tokens (
+                    cache_key VARCHAR(255) PRIMARY KEY,
+                    access_token TEXT NOT NULL,
+                    expiry TIMESTAMP WITH TIME ZONE NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        conn.commit()
+        conn.close()
+
+    def load(self, key):
+        """Returns the cached {'token', 'expiry'} entry for a key, or None."""
+        conn = self._connect()
+        if not conn:
+            return None
+        with conn.cursor() as cur:
+            cur.execute("SELECT access_token, expiry FROM oauth_tokens WHERE cache_key = %s;", (key,))
+            row = cur.fetchone()
+        conn.close()
+        return {"token": row[0], "expiry": row[1]} if row else None
+
+    def update(self, key, compute):
+        """
+        Replaces the entry for a key while holding an exclusive lock.
+
+        compute receives the current entry (or None) and returns the entry to store.
+        """
+        conn = self._connect()
+        if not conn:
+            return compute(None)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (key,))
+                cur.execute("SELECT access_token, expiry FROM oauth_tokens WHERE cache_key = %s;", (key,))
+                row = cur.fetchone()
+                current = {"token": row[0], "expiry": row[1]} if row else None
+                entry = compute(current)
+                if entry is not current:
+                    cur.execute(
+                        """
+                        INSERT INTO oauth_tokens (cache_key, access_token, expiry) VALUES (%s, %s, %s)
+                        ON CONFLICT (cache_key) DO UPDATE
+                        SET access_token = EXCLUDED.access_token, expiry = EXCLUDED.expiry, updated_at = CURRENT_TIMESTAMP;
+                        """,
+                        (key, entry["token"], entry["expiry"])
+                    )
+            # committing releases the advisory lock
+            conn.commit()
+        except Exception:
+            # a failed refresh must not leave other containers waiting on the lock
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return entry
+
+
+class FileTokenCache:
+    """
+    Shares access tokens between processes on one machine through a JSON file.
+
+    Used by the local admin scripts and as a stand-in for the Postgres cache in
+    tests. Refreshes are serialised with an exclusive lock on a sidecar file.
+    Where fcntl is unavailable (Windows) the lock only covers threads in this
+    process, so two scripts started at once may both refresh the token.
+    """
+
+    def __init__(self, path=TOKEN_CACHE_FILE):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            with self._thread_lock:
+                yield
+            return
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def load(self, key):
+        """Returns the cached {'token', 'expiry'} entry for a key, or None."""
+        entry = self._read().get(key)
+        if not entry:
+            return None
+        return {"token": entry["token"], "expiry": datetime.fromisoformat(entry["expiry"])}
+
+    def update(self, key, compute):
+        """
+        Replaces the entry for a key while holding an exclusive lock.
+
+        compute receives the current entry (or None) and returns the entry to store.
+        """
+        with self._locked():
+            current = self.load(key)
+            entry = compute(current)
+            if entry is not current:
+                entries = self._read()
+                entries[key] = {"token": entry["token"], "expiry": entry["expiry"].isoformat()}
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump(entries, f)
+                os.replace(self.path + ".tmp", self.path)
+            return entry
+
+
+class GmailCredentialsManager:
+    """
+    Hands out Gmail credentials whose access token is shared through a token cache.
+
+    A cold container first looks for a cached access token that is still valid
+    and only refreshes against Google when there is none. Once it has a token,
+    a background timer refreshes it shortly before it expires, so API calls
+    never wait on a refresh. The same Credentials object is updated in place,
+    so any client built from it always sees the current token.
+
+    Args:
+        token_info (dict): The authorized user info (refresh token, client id
+                           and secret) as stored in token.json.
+        scopes (list): The OAuth scopes the token was granted.
+        cache: A PostgresTokenCache or FileTokenCache.
+        refresh_margin (int): Seconds before expiry at which a token is refreshed.
+        background (bool): Whether to refresh proactively on a timer.
+    """
+
+    def __init__(self, token_info, scopes, cache, refresh_margin=REFRESH_MARGIN_SECONDS, background=True):
+        self.credentials = Credentials.from_authorized_user_info(token_info, scopes)
+        self.cache = cache
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.background = background
+        self.cache_key = _cache_key(token_info["refresh_token"])
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _is_fresh(self, entry):
+        """True if a cached entry is valid for longer than the refresh margin."""
+        return entry is not None and entry["expiry"] - datetime.now(timezone.utc) > self.refresh_margin
+
+    def _apply(self, entry):
+        """Loads a cached entry into the credentials (google-auth expects a naive UTC expiry)."""
+        self.credentials.token = entry["token"]
+        self.credentials.expiry = entry["expiry"].astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _refresh_if_stale(self, current):
+        """Called under the cache lock: keeps a fresh entry, or refreshes against Google."""
+        if self._is_fresh(current):
+            return current
+        print("🔑 Refreshing Gmail access token.")
+        self.credentials.refresh(Request())
+        return {"token": self.credentials.token, "expiry": self.credentials.expiry.replace(tzinfo=timezone.utc)}
+
+    def _schedule_refresh(self, expiry):
+        """Schedules a background refresh just before the token expires."""
+        if not self.background:
+            return
+        if self._timer:
+            self._timer.cancel()
+        delay = max(0.0, (expiry - datetime.now(timezone.utc) - self.refresh_margin).total_seconds())
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"❌ Background token refresh failed: {e}")
+
+    def refresh(self):
+        """Makes sure the credentials hold a token valid beyond the margin, sharing it via the cache."""
+        with self._lock:
+            entry = self.cache.load(self.cache_key)
+            if self._is_fresh(entry):
+                print("🔑 Reusing shared Gmail access token.")
+            else:
+                entry = self.cache.update(self.cache_key, self._refresh_if_stale)
+            self._apply(entry)
+            self._schedule_refresh(entry["expiry"])
+
+    def get_credentials(self):
+        """Returns credentials with a valid access token."""
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None or \
+                expiry.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc) <= self.refresh_margin:
+            self.refresh()
+        return self.credentials
+
+
+def seed_token_cache(creds, cache=None):
+    """
+    Stores a freshly issued access token in the token cache.
+
+    Used after an interactive OAuth flow, so the next process that uses the
+    same grant starts with a valid token instead of refreshing it.
+
+    Args:
+        creds (Credentials): The newly issued credentials.
+        cache (optional): The token cache to seed. Defaults to get_token_cache(),
+                          the cache the deployed agent reads from.
+    """
+    cache = cache or get_token_cache()
+    if not creds.refresh_token or not creds.token or creds.expiry is None:
+        return
+    entry = {"token": creds.token, "expiry": creds.expiry.replace(tzinfo=timezone.utc)}
+    cache.update(_cache_key(creds.refresh_token), lambda current: entry)
+
+
+def get_token_cache():
+    """Returns the token cache selected by TOKEN_CACHE_BACKEND, falling back to the local file."""
+    if TOKEN_CACHE_BACKEND == "postgres":
+        try:
+            return PostgresTokenCache()
+        except Exception as e:
+            print(f"❌ Postgres token cache unavailable ({e}). Falling back to {TOKEN_CACHE_FILE}.")
+    return FileTokenCache()
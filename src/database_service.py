@@ -1,21 +1,36 @@
 import psycopg2
+import psycopg2.errors
 import os
+from datetime import date
 from utils.secret_manager import get_secret
 
-db_secret_data = get_secret("prod/CustomerAgent/DatabasePassword")
-
 # database connection
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = db_secret_data['password']
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
+_db_password = None
+
+# monthly 'messages' partitions are created this many months ahead of today
+MESSAGE_PARTITION_MONTHS_AHEAD = 3
+# conversations with no new messages for this long are closed by the archival job
+CONVERSATION_IDLE_DAYS = int(os.getenv("CONVERSATION_IDLE_DAYS", "30"))
+# partitions older than this many months are moved to cold storage by the archival job
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "6"))
+
+
+def get_db_password():
+    """Fetches the database password from Secrets Manager on first use and reuses it afterwards."""
+    global _db_password
+    if _db_password is None:
+        _db_password = get_secret("prod/CustomerAgent/DatabasePassword")['password']
+    return _db_password
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database using environment variables."""
     # check if all required environment variables are set
-    if not all([DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT]):
+    if not all([DB_NAME, DB_USER, DB_HOST, DB_PORT]):
         print("❌ Database environment variables are not fully configured. Cannot connect.")
         return None
     
@@ -23,7 +38,7 @@ def get_db_connection():
         conn = psycopg2.connect(
             dbname=DB_NAME,
             user=DB_USER,
-            password=DB_PASSWORD,
+            password=get_db_password(),
             host=DB_HOST,
             port=DB_PORT
         )
@@ -32,10 +47,32 @@ def get_db_connection():
         print(f"❌ Could not connect to the database: {e}")
         return None
 
+def _month_start(year, month):
+    """Returns the first day of a month as a date, normalising month overflow."""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return date(year, month, 1)
+
+def _ensure_message_partitions(cur, first_month, months_ahead=MESSAGE_PARTITION_MONTHS_AHEAD):
+    """Creates the monthly partitions of 'messages' from first_month up to a few months ahead."""
+    today = date.today()
+    month = _month_start(first_month.year, first_month.month)
+    last = _month_start(today.year, today.month + months_ahead)
+    while month <= last:
+        next_month = _month_start(month.year, month.month + 1)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS messages_y{month:%Y}m{month:%m} PARTITION OF messages "
+            "FOR VALUES FROM (%s) TO (%s);",
+            (month, next_month)
+        )
+        month = next_month
+
 def setup_database():
     """
     Connects to the database and creates the necessary tables if they don't exist.
     This should be called once on application startup.
+
+    The 'messages' table is partitioned by month on created_at. A database that
+    still has the original unpartitioned table is migrated in place.
     """
     print("Attempting to set up database tables...")
     conn = get_db_connection()
@@ -44,6 +81,9 @@ def setup_database():
         return
         
     with conn.cursor() as cur:
+        # Concurrent cold starts would race on the migration below; the lock is held until commit
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('setup_database'));")
+
         # Create the 'conversations' table to track email threads
         cur.execute("""
             CREATE TABLE IF NOT EXISTS conversations (
@@ -54,39 +94,137 @@ def setup_database():
                 updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
             );
         """)
-        # Create the 'messages' table to store individual messages
+        cur.execute("CREATE INDEX IF NOT EXISTS conversations_status_updated_idx ON conversations (status, updated_at);")
+
+        # Move an unpartitioned 'messages' table out of the way before creating the partitioned one
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages');")
+        existing = cur.fetchone()
+        migrating = existing is not None and existing[0] == 'r'
+        if migrating:
+            print("📦 Migrating 'messages' to a monthly partitioned table...")
+            cur.execute("ALTER TABLE messages RENAME TO messages_unpartitioned;")
+            cur.execute("ALTER TABLE messages_unpartitioned ADD COLUMN IF NOT EXISTS gmail_message_id VARCHAR(255);")
+
+        # Create the 'messages' table to store individual messages, partitioned by month
         cur.execute("""
             CREATE TABLE IF NOT EXISTS messages (
-                message_id SERIAL PRIMARY KEY,
+                message_id BIGSERIAL,
                 thread_id VARCHAR(255) REFERENCES conversations(thread_id),
                 sender VARCHAR(50) NOT NULL, -- 'user' or 'agent'
                 content TEXT NOT NULL,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                gmail_message_id VARCHAR(255),
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                answered_at TIMESTAMP WITH TIME ZONE, -- set on user messages once a run has replied to or escalated them
+                PRIMARY KEY (message_id, created_at)
+            ) PARTITION BY RANGE (created_at);
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS messages_thread_created_idx ON messages (thread_id, created_at);")
+
+        # Partitioned tables created before 'answered_at' existed get the column added
+        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'messages' AND column_name = 'answered_at';")
+        backfill_answered = migrating or cur.fetchone() is None
+        cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS answered_at TIMESTAMP WITH TIME ZONE;")
+        cur.execute("CREATE INDEX IF NOT EXISTS messages_unanswered_idx ON messages (thread_id) WHERE sender = 'user' AND answered_at IS NULL;")
+        # Cold storage for partitions that have aged out of the hot table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS messages_archive (
+                message_id BIGINT NOT NULL,
+                thread_id VARCHAR(255),
+                sender VARCHAR(50) NOT NULL,
+                content TEXT NOT NULL,
+                gmail_message_id VARCHAR(255),
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                answered_at TIMESTAMP WITH TIME ZONE,
+                archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
             );
         """)
+        cur.execute("ALTER TABLE messages_archive ADD COLUMN IF NOT EXISTS answered_at TIMESTAMP WITH TIME ZONE;")
+        cur.execute("CREATE INDEX IF NOT EXISTS messages_archive_thread_idx ON messages_archive (thread_id, created_at);")
+
+        if migrating:
+            cur.execute("SELECT MIN(created_at) FROM messages_unpartitioned;")
+            oldest = cur.fetchone()[0]
+            _ensure_message_partitions(cur, oldest.date() if oldest else date.today())
+            cur.execute("""
+                INSERT INTO messages (message_id, thread_id, sender, content, gmail_message_id, created_at)
+                SELECT message_id, thread_id, sender, content, gmail_message_id, COALESCE(created_at, CURRENT_TIMESTAMP)
+                FROM messages_unpartitioned;
+            """)
+            cur.execute("SELECT setval(pg_get_serial_sequence('messages', 'message_id'), COALESCE(MAX(message_id), 0) + 1, false) FROM messages;")
+            cur.execute("DROP TABLE messages_unpartitioned;")
+            print("✅ 'messages' migrated to monthly partitions.")
+        else:
+            _ensure_message_partitions(cur, date.today())
+
+        if backfill_answered:
+            # one-off: user messages that already have a later agent reply count as answered
+            cur.execute("""
+                UPDATE messages m SET answered_at = m.created_at
+                WHERE m.sender = 'user' AND m.answered_at IS NULL AND EXISTS (
+                    SELECT 1 FROM messages a
+                    WHERE a.thread_id = m.thread_id AND a.sender = 'agent' AND a.created_at >= m.created_at
+                );
+            """)
     conn.commit()
     conn.close()
     print("✅ Database tables are set up successfully.")
 
-def save_message(thread_id, user_email, sender, content):
-    """Saves a new message to the database for a specific conversation thread."""
+def save_message(thread_id, user_email, sender, content, gmail_message_id=None, answers=None):
+    """
+    Saves a new message to the database for a specific conversation thread.
+
+    If the month's partition of 'messages' does not exist yet (no cold start or
+    archival run has created it), it is created and the save is retried.
+
+    Args:
+        answers (list, optional): For an agent reply, the message_ids of the user
+                                  messages it answers. They are marked answered in
+                                  the same transaction.
+    """
     conn = get_db_connection()
     if not conn:
         return
-        
+
+    try:
+        try:
+            _insert_message(conn, thread_id, user_email, sender, content, gmail_message_id, answers)
+        except psycopg2.errors.CheckViolation:
+            # raised as "no partition of relation found for row"
+            conn.rollback()
+            today = date.today()
+            print("📦 No 'messages' partition for this month. Creating it.")
+            with conn.cursor() as cur:
+                # start a month back in case the database's clock is in an earlier month than ours
+                _ensure_message_partitions(cur, _month_start(today.year, today.month - 1))
+            conn.commit()
+            _insert_message(conn, thread_id, user_email, sender, content, gmail_message_id, answers)
+    finally:
+        conn.close()
+
+def _insert_message(conn, thread_id, user_email, sender, content, gmail_message_id, answers):
+    """Inserts one message and updates its conversation, in a single transaction."""
     with conn.cursor() as cur:
-        # First, ensure the conversation record exists. If it does, this does nothing.
+        # First, ensure the conversation record exists and mark it as touched. A new
+        # user message (re)opens the conversation, an agent reply marks it answered.
+        status = "answered" if sender == "agent" else "open"
         cur.execute(
-            "INSERT INTO conversations (thread_id, user_email) VALUES (%s, %s) ON CONFLICT (thread_id) DO NOTHING;",
-            (thread_id, user_email)
+            """
+            INSERT INTO conversations (thread_id, user_email, status) VALUES (%s, %s, %s)
+            ON CONFLICT (thread_id) DO UPDATE SET status = EXCLUDED.status, updated_at = CURRENT_TIMESTAMP;
+            """,
+            (thread_id, user_email, status)
         )
         # Then, insert the new message
         cur.execute(
-            "INSERT INTO messages (thread_id, sender, content) VALUES (%s, %s, %s);",
-            (thread_id, sender, content)
+            "INSERT INTO messages (thread_id, sender, content, gmail_message_id) VALUES (%s, %s, %s, %s);",
+            (thread_id, sender, content, gmail_message_id)
         )
+        if answers:
+            cur.execute(
+                "UPDATE messages SET answered_at = CURRENT_TIMESTAMP WHERE thread_id = %s AND message_id = ANY(%s);",
+                (thread_id, list(answers))
+            )
     conn.commit()
-    conn.close()
 
 def get_conversation_history(thread_id):
     """Retrieves and formats the conversation history for a given thread_id."""
@@ -96,15 +234,144 @@ def get_conversation_history(thread_id):
         
     history = []
     with conn.cursor() as cur:
-        cur.execute(
-            "SELECT sender, content FROM messages WHERE thread_id = %s ORDER BY created_at ASC;",
-            (thread_id,)
-        )
-        for record in cur.fetchall():
-            sender, content = record
-            history.append(f"{sender.capitalize()}: {content}")
+        cur.execute("SELECT created_at FROM conversations WHERE thread_id = %s;", (thread_id,))
+        conversation = cur.fetchone()
+        if conversation:
+            # The conversation's start is sent as a literal bound, so Postgres can
+            # skip the partitions from before it when planning the query
+            cur.execute(
+                """
+                SELECT sender, content FROM messages
+                WHERE thread_id = %s AND created_at >= %s
+                ORDER BY created_at ASC;
+                """,
+                (thread_id, conversation[0])
+            )
+            for record in cur.fetchall():
+                sender, content = record
+                history.append(f"{sender.capitalize()}: {content}")
     
     conn.close()
     
     # Format the history into a simple string for the LLM
     return "\n".join(history)
+
+
+def mark_messages_handled(thread_id, message_ids):
+    """
+    Marks user messages as handled without saving a reply, e.g. when their run was escalated.
+
+    Handled messages are no longer pending, so they are not merged into later
+    questions in the thread and a redelivered job for them is skipped.
+    """
+    if not message_ids:
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE messages SET answered_at = CURRENT_TIMESTAMP WHERE thread_id = %s AND message_id = ANY(%s);",
+            (thread_id, list(message_ids))
+        )
+    conn.commit()
+    conn.close()
+
+def get_pending_user_messages(thread_id):
+    """
+    Retrieves the user messages in a thread that no finished run has replied to or escalated yet.
+
+    Returns a list of (message_id, gmail_message_id, content, created_at) tuples
+    ordered from oldest to newest, or None if the database is unavailable.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT message_id, gmail_message_id, content, created_at FROM messages
+            WHERE thread_id = %s AND sender = 'user' AND answered_at IS NULL
+            ORDER BY created_at ASC;
+            """,
+            (thread_id,)
+        )
+        pending = cur.fetchall()
+
+    conn.close()
+    return pending
+
+
+def close_idle_conversations(idle_days=CONVERSATION_IDLE_DAYS):
+    """Marks conversations with no new messages in the last idle_days as closed. Returns how many were closed."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE conversations SET status = 'closed', updated_at = CURRENT_TIMESTAMP
+            WHERE status <> 'closed' AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s);
+            """,
+            (idle_days,)
+        )
+        closed = cur.rowcount
+    conn.commit()
+    conn.close()
+    return closed
+
+def archive_old_partitions(retention_months=MESSAGE_RETENTION_MONTHS):
+    """
+    Moves monthly 'messages' partitions older than the retention period into 'messages_archive'.
+
+    Each partition is detached, copied into the cold storage table and dropped in
+    a single transaction, so the hot table only ever holds recent months. A
+    partition that still holds messages of a conversation that is not closed yet
+    is kept, so an active thread never loses its history; it is archived by a
+    later run once those conversations have been closed. Future partitions are
+    topped up at the same time. Returns the archived partition names.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return []
+
+    today = date.today()
+    cutoff = _month_start(today.year, today.month - retention_months)
+    archived = []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'messages'
+            ORDER BY child.relname;
+        """)
+        for (partition,) in cur.fetchall():
+            # partitions are named messages_yYYYYmMM after the month they hold
+            month = date(int(partition[10:14]), int(partition[15:17]), 1)
+            if month >= cutoff:
+                continue
+            cur.execute(f"""
+                SELECT EXISTS (
+                    SELECT 1 FROM {partition} m JOIN conversations c ON c.thread_id = m.thread_id
+                    WHERE c.status <> 'closed'
+                );
+            """)
+            if cur.fetchone()[0]:
+                print(f"⏭️ Keeping {partition}: it holds messages of conversations that are still open.")
+                continue
+            cur.execute(f"ALTER TABLE messages DETACH PARTITION {partition};")
+            cur.execute(f"""
+                INSERT INTO messages_archive (message_id, thread_id, sender, content, gmail_message_id, created_at, answered_at)
+                SELECT message_id, thread_id, sender, content, gmail_message_id, created_at, answered_at FROM {partition};
+            """)
+            cur.execute(f"DROP TABLE {partition};")
+            archived.append(partition)
+
+        _ensure_message_partitions(cur, today)
+    conn.commit()
+    conn.close()
+    return archived
@@ -1,12 +1,14 @@
 from src.gmail_service import send_email
 
-def email_sender_node(state, service):
+def email_sender_node(state, service, router=None):
     """
     Node for sending the final, approved email reply.
     
     Args:
         state (GraphState): The current state of the graph.
         service: The authenticated Gmail API service object.
+        router (ModelRouter, optional): Records the successful send against the
+                                        model routes this run took.
     
     Returns:
         dict: An empty dictionary as this is a final step.
@@ -31,4 +33,6 @@ def email_sender_node(state, service):
     )
     
     print("✅ Email sent successfully.")
+    if router:
+        router.record_outcome(state.get("model_routes") or {}, escalated=False)
     return {}
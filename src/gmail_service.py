@@ -1,11 +1,15 @@
 import os.path
 import base64
 import json
+import time
+import threading
+from functools import lru_cache
 from email.message import EmailMessage
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from utils.secret_manager import get_secret
+from src.credentials_service import GmailCredentialsManager, get_token_cache
 
 # This is the version that uses the token.json from Secrets Manager
 # It is the correct version for your AWS Lambda environment.
@@ -15,24 +19,74 @@ SCOPES = [
     "https://www.googleapis.com/auth/gmail.send"
 ]
 
-def get_gmail_service():
+# the Gmail service built for this container, reused by every handler invocation
+_gmail_service = None
+# hands out the container's Gmail credentials, shared by every client it builds
+_credentials_manager = None
+_credentials_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _gmail_discovery_document():
+    """
+    Loads and parses the Gmail v1 discovery document once per container.
+
+    The document is the copy bundled with google-api-python-client, so no
+    network request is made to discover the API.
+    """
+    document = get_static_doc("gmail", "v1")
+    if document is None:
+        raise RuntimeError("Bundled Gmail discovery document not found. Is google-api-python-client >= 2.0 installed?")
+    return json.loads(document)
+
+def build_gmail_client(creds):
+    """
+    Builds a Gmail API client from credentials, entirely offline.
+
+    Args:
+        creds (Credentials): Authorized Google OAuth credentials.
+
+    Returns:
+        Resource: A Gmail API client.
+    """
+    start = time.perf_counter()
+    service = build_from_document(_gmail_discovery_document(), credentials=creds)
+    print(f"⏱️ Gmail client built in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return service
+
+def get_gmail_service(cached=True):
     """
     Authenticates with the Gmail API using a token stored in an environment variable.
+
+    The client is built once per container and reused. Google API clients are
+    not thread-safe, so concurrent callers should pass cached=False to get a
+    client of their own; all clients share the same credentials, whose access
+    token comes from the shared token cache.
     """
-    token_json_str = get_secret("prod/CustomerAgent/GmailTokenS")
-    
-    if not token_json_str:
-        print("❌ GMAIL_TOKEN_JSON environment variable not set.")
-        return None
+    global _gmail_service, _credentials_manager
+    if cached and _gmail_service is not None:
+        return _gmail_service
 
     try:
-        creds = Credentials.from_authorized_user_info(token_json_str, SCOPES)
-        service = build("gmail", "v1", credentials=creds)
-        return service
+        with _credentials_lock:
+            if _credentials_manager is None:
+                token_json_str = get_secret("prod/CustomerAgent/GmailTokenS")
+
+                if not token_json_str:
+                    print("❌ GMAIL_TOKEN_JSON environment variable not set.")
+                    return None
+
+                # the access token is shared with other containers through the token cache
+                _credentials_manager = GmailCredentialsManager(token_json_str, SCOPES, get_token_cache())
+        creds = _credentials_manager.get_credentials()
+        service = build_gmail_client(creds)
     except Exception as e:
         print(f"❌ Error during Gmail authentication: {e}")
         return None
 
+    if cached:
+        _gmail_service = service
+    return service
+
 def get_latest_email(service, user_id="me"):
     """
     Fetches the most recent unread email ONLY from a specific sender.
@@ -59,6 +113,7 @@ def get_latest_email(service, user_id="me"):
             "thread_id": msg.get("threadId"),
             "subject": next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject"),
             "sender": next((h["value"] for h in headers if h["name"] == "From"), "No Sender"),
+            "to": next((h["value"] for h in headers if h["name"] == "To"), ""),
         }
 
         body = "No Body Content"
@@ -1,7 +1,7 @@
 import os
-import chromadb
+import operator
 from dotenv import load_dotenv
-from typing import TypedDict
+from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, END
 from functools import partial
 
@@ -10,10 +10,15 @@ from src.agents.guard_agent import guardrail_node, GuardrailDecision
 from src.agents.customer_agent import customer_agent_node
 from src.agents.manager_agent import manager_agent_node
 from src.email_sender_node import email_sender_node 
+from src.llm_calls import DEFAULT_NODE_DEADLINES, LLM_REQUEST_TIMEOUT_SECONDS
+from src.prompt_assembly import DEFAULT_CONTEXT_BUDGETS
+from src.knowledge_base import index_cache as default_index_cache
+from src.model_router import ModelRouter
+from src.prompt_cache import PromptCache, GeminiCacheProvider, get_cache_registry
+from src.grounding import grounding_check_node, DEFAULT_CONFIDENCE_THRESHOLD, DEFAULT_AUDIT_RATE
 
 # LlamaIndex imports
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, Settings
-from llama_index.vector_stores.chroma import ChromaVectorStore
+from llama_index.core import Settings
 from llama_index.llms.gemini import Gemini
 from llama_index.embeddings.gemini import GeminiEmbedding
 from utils.secret_manager import get_secret
@@ -32,43 +37,28 @@ else:
     exit()
 
 # setting the Gemini model
-Settings.llm = Gemini(model="models/gemini-2.5-flash")
+Settings.llm = Gemini(model="models/gemini-2.5-flash", request_options={"timeout": LLM_REQUEST_TIMEOUT_SECONDS})
 Settings.embed_model = GeminiEmbedding(model_name="models/embedding-001")
 print("⚙️ LlamaIndex components configured.")
 
-# ChromDB setup in the temp folder (used in serverless Lambda)
-db = chromadb.PersistentClient(path= "/tmp/chroma_db")
-chroma_collection = db.get_or_create_collection("visa_agent_collection")
-vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-# initialize the document if no vector database is found
-if chroma_collection.count() == 0:
-    print("📄 Collection is empty. Ingesting new documents.")
-    try:
-        reader = SimpleDirectoryReader(input_files=["./data/485Visa.md"])
-        documents = reader.load_data()
-        index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
-        print("✅ Index created and stored successfully.")
-    except Exception as e:
-        print(f"❌ Error during initial document ingestion: {e}")
-        exit()
-else: # if the chromaDB already exist
-    print("✅ Loading index from existing ChromaDB collection.")
-    index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-    print("✅ Index loaded successfully.")
-
 # define the graph state (LangGraph)
 class GraphState(TypedDict):
     question: str
     original_email: dict 
+    knowledge_base: str
     context_str: str
+    context_chunks: list
+    retrieval_scores: list
+    grounding_confidence: float
     chat_history: str
     drafted_answer: str
     guardrail_decision: GuardrailDecision
     final_decision: dict
+    deadline_exceeded: str
+    # the model route each node took, merged across nodes
+    model_routes: Annotated[dict, operator.or_]
 
-def escalation_node(state: GraphState):
+def escalation_node(state: GraphState, router=None):
     """
     Handles the terminal state of escalating a task to a human.
 
@@ -78,6 +68,8 @@ def escalation_node(state: GraphState):
 
     Args:
         state (GraphState): The current state of the graph.
+        router (ModelRouter, optional): Records the escalation against the
+                                        model routes this run took.
 
     Returns:
         An empty dictionary, as it does not modify the state.
@@ -86,15 +78,20 @@ def escalation_node(state: GraphState):
 
     guard_decision = state.get("guardrail_decision")
     manager_decision = state.get("final_decision")
+    timed_out_node = state.get("deadline_exceeded")
     reason = "No reason provided."
 
     # determine the reason based on which node triggered the escalation.
-    if guard_decision and not guard_decision.is_safe:
+    if timed_out_node:
+        reason = f"Deadline exceeded in '{timed_out_node}'."
+    elif guard_decision and not guard_decision.is_safe:
         reason = guard_decision.reason
     elif manager_decision:
         reason = manager_decision.get("reason", "Manager escalated.")
     
     print(f"Reason for Escalation: {reason}")
+    if router:
+        router.record_outcome(state.get("model_routes") or {}, escalated=True)
     return {}
 
 def should_process(state: GraphState) -> str:
@@ -120,6 +117,53 @@ def should_process(state: GraphState) -> str:
         print("Decision: Escalate to human.")
         return "escalate"
 
+def should_review(state: GraphState) -> str:
+    """
+    A conditional edge that routes the workflow after the customer agent.
+
+    A draft only moves on to the grounding check and review if the customer
+    agent finished before its deadline; otherwise there is nothing to review
+    and the task is escalated.
+
+    Args:
+        state (GraphState): The current state of the graph.
+
+    Returns:
+        'review': If a draft was produced.
+        'escalate': If drafting ran out of time.
+    """
+    print("--- ROUTING AFTER CUSTOMER AGENT ---")
+
+    if state.get("deadline_exceeded"):
+        print("Decision: Drafting exceeded its deadline. Escalating.")
+        return "escalate"
+    else:
+        print("Decision: Check how well the draft is grounded.")
+        return "review"
+
+def should_skip_review(state: GraphState) -> str:
+    """
+    A conditional edge that routes the workflow after the grounding check.
+
+    The grounding check only sets a 'final_decision' when it approved the draft
+    itself, in which case the manager review is skipped.
+
+    Args:
+        state (GraphState): The current state of the graph.
+
+    Returns:
+        'send_email': If the draft was approved by the grounding check.
+        'review': If the draft still needs the manager's review.
+    """
+    print("--- ROUTING AFTER GROUNDING CHECK ---")
+
+    if state.get("final_decision", {}).get("decision") == "send":
+        print("Decision: Draft is well grounded. Skipping manager review.")
+        return "send_email"
+    else:
+        print("Decision: Send draft to manager for review.")
+        return "review"
+
 def should_escalate(state: GraphState) -> str:
     """
     A conditional edge that routes the workflow after the manager's review.
@@ -143,7 +187,9 @@ def should_escalate(state: GraphState) -> str:
         print("Decision: Manager did not approve. Escalating.")
         return "escalate"
 
-def build_graph(gmail_service, index):
+def build_graph(gmail_service, index=None, node_deadlines=None, hedge_nodes=("guardrail", "manager_agent"), context_budgets=None, checkpointer=None, index_cache=None, node_models=None, router=None,
+                review_confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, review_audit_rate=DEFAULT_AUDIT_RATE,
+                prompt_cache=None):
     """
     Constructs and compiles the LangGraph StateGraph for the customer service agent.
 
@@ -152,23 +198,88 @@ def build_graph(gmail_service, index):
 
     Args:
         gmail_service: An authenticated Google API client for sending emails.
-        index: The LlamaIndex VectorStoreIndex for the RAG agent.
+        index (optional): A fixed LlamaIndex VectorStoreIndex for the RAG agent. If
+                          None, each email is answered from the knowledge base it
+                          resolves to, loaded through the index cache.
+        node_deadlines (dict, optional): Seconds each LLM node may take, keyed by
+                                         node name. Missing nodes use the defaults
+                                         in DEFAULT_NODE_DEADLINES, and a value of
+                                         None disables the deadline for that node.
+        hedge_nodes (tuple): Nodes whose LLM calls are hedged with a second
+                             request once they run slower than their p95 latency.
+        context_budgets (dict, optional): Token budget for retrieved context in
+                                          each node's prompt, keyed by node name.
+                                          Missing nodes use DEFAULT_CONTEXT_BUDGETS.
+        checkpointer (BaseCheckpointSaver, optional): Persists the state after every
+                                                      node so an interrupted run can
+                                                      resume from its last completed node.
+        index_cache (IndexCache, optional): The LRU of knowledge base indexes to use
+                                            when no fixed index is given. Defaults to
+                                            the container-wide cache.
+        node_models (dict, optional): The 'light' and 'heavy' model names for each
+                                      node, keyed by node name. Missing nodes use
+                                      DEFAULT_NODE_MODELS.
+        router (ModelRouter, optional): Routes each LLM call to the light or heavy
+                                        model. Built from node_models if None.
+        review_confidence_threshold (float): Drafts whose grounding confidence reaches
+                                             this value are sent without the manager
+                                             review. Use a value above 1 to always review.
+        review_audit_rate (float): Fraction of confident drafts still sent to the
+                                   manager for auditing.
+        prompt_cache (PromptCache, optional): Caches the static prefix of each prompt
+                                              on the provider. Defaults to a Gemini
+                                              context cache when the router is built
+                                              here; an explicit router keeps its own.
 
     Returns:
         A compiled LangGraph workflow ready to be executed.
     """
     workflow = StateGraph(GraphState)
 
+    deadlines = {**DEFAULT_NODE_DEADLINES, **(node_deadlines or {})}
+    budgets = {**DEFAULT_CONTEXT_BUDGETS, **(context_budgets or {})}
+    if router is None:
+        prompt_cache = prompt_cache or PromptCache(GeminiCacheProvider(), registry=get_cache_registry())
+        router = ModelRouter(node_models=node_models, prompt_cache=prompt_cache)
+
     # use functools.partial to pre-fill arguments for nodes that need external dependencies.
-    customer_agent_with_index = partial(customer_agent_node, index=index)
-    email_sender_with_service = partial(email_sender_node, service=gmail_service) 
+    guardrail_with_deadline = partial(
+        guardrail_node,
+        deadline=deadlines["guardrail"],
+        hedge="guardrail" in hedge_nodes,
+        router=router,
+    )
+    customer_agent_with_index = partial(
+        customer_agent_node,
+        index=index,
+        index_cache=index_cache or default_index_cache,
+        deadline=deadlines["customer_agent"],
+        router=router,
+        prompt_cache=router.prompt_cache,
+        context_budget=budgets["customer_agent"],
+    )
+    manager_agent_with_deadline = partial(
+        manager_agent_node,
+        deadline=deadlines["manager_agent"],
+        hedge="manager_agent" in hedge_nodes,
+        router=router,
+        context_budget=budgets["manager_agent"],
+    )
+    email_sender_with_service = partial(email_sender_node, service=gmail_service, router=router)
+    escalation_with_router = partial(escalation_node, router=router)
+    grounding_check_with_threshold = partial(
+        grounding_check_node,
+        threshold=review_confidence_threshold,
+        audit_rate=review_audit_rate,
+    )
 
     # add all the defined functions as nodes in the graph.
-    workflow.add_node("guardrail", guardrail_node)
+    workflow.add_node("guardrail", guardrail_with_deadline)
     workflow.add_node("customer_agent", customer_agent_with_index)
-    workflow.add_node("manager_agent", manager_agent_node)
+    workflow.add_node("grounding_check", grounding_check_with_threshold)
+    workflow.add_node("manager_agent", manager_agent_with_deadline)
     workflow.add_node("send_email", email_sender_with_service) 
-    workflow.add_node("escalate", escalation_node)
+    workflow.add_node("escalate", escalation_with_router)
 
     # defining the graph path
     # The entry point is the guardrail.
@@ -181,8 +292,20 @@ def build_graph(gmail_service, index):
         {"continue": "customer_agent", "escalate": "escalate"},
     )
 
-    # after the customer agent drafts a response, it always goes to the manager.
-    workflow.add_edge("customer_agent", "manager_agent")
+    # after the customer agent drafts a response, its grounding is checked unless
+    # drafting ran out of time.
+    workflow.add_conditional_edges(
+        "customer_agent",
+        should_review,
+        {"review": "grounding_check", "escalate": "escalate"},
+    )
+
+    # well-grounded drafts are sent directly; the rest go to the manager.
+    workflow.add_conditional_edges(
+        "grounding_check",
+        should_skip_review,
+        {"send_email": "send_email", "review": "manager_agent"},
+    )
 
     # after the manager reviews, decide whether to send the email or escalate.
     workflow.add_conditional_edges(
@@ -196,4 +319,4 @@ def build_graph(gmail_service, index):
     workflow.add_edge("escalate", END)
 
     # compile the graph into a runnable object.
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
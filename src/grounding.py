@@ -0,0 +1,147 @@
+import re
+import random
+
+# drafts at or above this confidence skip the manager review.
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+# fraction of confident drafts still sent to the manager, to audit the gate.
+DEFAULT_AUDIT_RATE = 0.1
+
+# drafts outside these bounds (in characters) are always reviewed.
+MIN_ANSWER_CHARS = 40
+MAX_ANSWER_CHARS = 1500
+
+# a draft sentence counts as grounded when this share of its content words appears in the context.
+SENTENCE_SUPPORT_THRESHOLD = 0.6
+
+# the same markers the manager prompt escalates on, plus the customer agent's "no answer" sentence.
+UNCERTAINTY_MARKERS = ["usually", "might", "it's possible", "in most cases", "generally"]
+NO_ANSWER_MARKER = "i was unable to find a definitive answer"
+
+# units a number in a draft must share with the same number in the context.
+QUANTITY_UNITS = {"year", "month", "week", "day", "hour", "aud", "dollar", "%", "percent", "point"}
+
+_FINAL_ANSWER = re.compile(r"<final_answer>(.*?)</final_answer>", re.DOTALL)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"[a-z0-9']+")
+_QUANTITY = re.compile(r"(\$)?(\d[\d,]*(?:\.\d+)?)(?:[\s-]*(%|[a-z]+))?")
+
+
+def _content_words(text):
+    """Returns the lower-cased words in the text that carry meaning: long words and all numbers."""
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 3 or any(c.isdigit() for c in word)]
+
+
+def _quantities(text):
+    """
+    Returns the numbers in the text as (number, unit) pairs.
+
+    Numbers are normalised ("1,200" -> "1200") and the unit is the currency
+    sign before the number or the known unit word after it, singularised, or
+    None when there is neither.
+    """
+    quantities = set()
+    for currency, number, word in _QUANTITY.findall(text.lower()):
+        unit = word[:-1] if word.endswith("s") and word[:-1] in QUANTITY_UNITS else word
+        if currency:
+            unit = "$"
+        elif unit not in QUANTITY_UNITS:
+            unit = None
+        quantities.add((number.replace(",", ""), unit))
+    return quantities
+
+
+def _unsupported_quantities(answer, context_str):
+    """Returns the numbers in the answer that do not appear in the context with the same unit."""
+    context = _quantities(context_str or "")
+    context_numbers = {number for number, _ in context}
+    unsupported = []
+    for number, unit in _quantities(answer):
+        if (number, unit) in context:
+            continue
+        # a bare number on either side only has to match the number itself
+        if number in context_numbers and (unit is None or (number, None) in context):
+            continue
+        unsupported.append((number, unit))
+    return unsupported
+
+
+def grounding_confidence(drafted_answer, context_str, retrieval_scores):
+    """
+    Scores how well a draft is grounded in its retrieved context, without calling an LLM.
+
+    The score is the mean of the best retrieval similarity and the share of draft
+    sentences whose content words are mostly found in the context. Drafts that
+    are too short or long, hedge with uncertainty markers, say no answer was
+    found, or state any number (age, fee, duration) that the context does not
+    give with the same unit score 0 so they are always reviewed.
+
+    Args:
+        drafted_answer (str): The customer agent's draft.
+        context_str (str): The context the draft was written from.
+        retrieval_scores (list): Cosine similarities of the retrieved chunks.
+
+    Returns:
+        float: A confidence between 0 and 1.
+    """
+    match = _FINAL_ANSWER.search(drafted_answer or "")
+    answer = (match.group(1) if match else drafted_answer or "").strip()
+    lowered = answer.lower()
+
+    if not MIN_ANSWER_CHARS <= len(answer) <= MAX_ANSWER_CHARS:
+        return 0.0
+    if NO_ANSWER_MARKER in lowered or any(marker in lowered for marker in UNCERTAINTY_MARKERS):
+        return 0.0
+    # word overlap cannot tell "35 years" from "40 years", so numbers must match exactly
+    if _unsupported_quantities(answer, context_str):
+        return 0.0
+
+    scores = [score for score in retrieval_scores or [] if score is not None]
+    retrieval = min(max(max(scores), 0.0), 1.0) if scores else 0.0
+
+    # greetings and sign-offs are too short to count as claims.
+    context_words = set(_content_words(context_str or ""))
+    claims = [words for words in map(_content_words, _SENTENCE_SPLIT.split(answer)) if len(words) >= 3]
+    if not claims:
+        return 0.0
+    grounded = sum(
+        1 for words in claims
+        if sum(word in context_words for word in words) / len(words) >= SENTENCE_SUPPORT_THRESHOLD
+    )
+    support = grounded / len(claims)
+
+    return (retrieval + support) / 2
+
+
+def grounding_check_node(state, threshold=DEFAULT_CONFIDENCE_THRESHOLD, audit_rate=DEFAULT_AUDIT_RATE):
+    """
+    Decides whether a draft is grounded well enough to skip the manager review.
+
+    Confident drafts are approved directly, except for a random sample that is
+    still sent to the manager so the gate can be audited.
+
+    Args:
+        state (GraphState): The current state of the graph. This function reads
+                            'drafted_answer', 'context_str' and 'retrieval_scores'.
+        threshold (float): The confidence at or above which review is skipped.
+        audit_rate (float): The fraction of confident drafts still reviewed.
+
+    Returns:
+        Dict[str, Any]: The 'grounding_confidence', plus an approving
+                        'final_decision' when the review is skipped.
+    """
+    print("--- CHECKING DRAFT GROUNDING ---")
+    confidence = grounding_confidence(
+        state.get("drafted_answer"),
+        state.get("context_str"),
+        state.get("retrieval_scores"),
+    )
+    print(f"📐 Grounding confidence: {confidence:.2f} (threshold {threshold:.2f}).")
+
+    if confidence < threshold:
+        return {"grounding_confidence": confidence}
+    if random.random() < audit_rate:
+        print("🔍 Confident draft sampled for manager audit.")
+        return {"grounding_confidence": confidence}
+
+    decision = {"decision": "send", "reason": f"Auto-approved: grounding confidence {confidence:.2f}."}
+    return {"grounding_confidence": confidence, "final_decision": decision}
@@ -0,0 +1,82 @@
+from src.database_service import get_conversation_history, save_message, mark_messages_handled
+from src.coalescing import coalesce_thread
+from src.checkpoint_service import checkpoint_config
+
+def process_job(app, message_body, checkpointer=None, hold=True):
+    """
+    Runs the agent workflow for a single job from the queue.
+
+    This is shared by the agent Lambda and the long-running worker so both
+    process jobs identically: coalesce the thread, fetch its history, run (or
+    resume) the graph and record the agent's reply.
+
+    Args:
+        app: The compiled LangGraph workflow from build_graph.
+        message_body (dict): The job created by the ingestion Lambda.
+        checkpointer (BaseCheckpointSaver, optional): The checkpointer the graph
+                                                      was compiled with, if any.
+        hold (bool): Whether to wait out a thread's coalescing window. If False,
+                     ThreadStillActive is raised for the caller to defer the job.
+
+    Returns:
+        dict | None: The final graph state, or None if the job was coalesced
+                     into another job and skipped.
+    """
+    thread_id = message_body['thread_id']
+    original_email = message_body['original_email']
+
+    print(f"--- Processing Thread ID: {thread_id} ---")
+
+    # 0. Merge any burst of unanswered messages in this thread into one question
+    coalesced = coalesce_thread(thread_id, original_email.get('id'), message_body['user_question'], hold=hold)
+    if coalesced is None:
+        return None
+    user_question, answered_message_ids = coalesced
+
+    # 1. Fetch the complete conversation history from the database
+    chat_history = get_conversation_history(thread_id)
+
+    # 2. Prepare the input for the LangGraph application
+    inputs = {
+        "question": user_question,
+        "original_email": original_email,
+        "chat_history": chat_history
+    }
+    
+    print("\n--- Invoking Agent Workflow ---")
+    final_state = None
+    config = checkpoint_config(thread_id, original_email.get('id'))
+    snapshot = app.get_state(config) if checkpointer else None
+
+    if snapshot and snapshot.next:
+        # A previous delivery of this job was interrupted; resume where it stopped
+        print(f"♻️ Resuming workflow from checkpoint at {snapshot.next}.")
+        final_state = app.invoke(None, config)
+    elif snapshot and snapshot.values:
+        # A previous delivery finished the workflow but not the bookkeeping below
+        print("♻️ Workflow already completed for this job. Reusing its final state.")
+        final_state = snapshot.values
+    else:
+        final_state = app.invoke(inputs, config)
+    
+    # 3. Save the agent's final response if it was approved. Either way the run has
+    # finished, so the messages merged into it are no longer pending; anything that
+    # arrived while it ran stays pending for its own job
+    if final_state:
+        manager_decision = final_state.get("final_decision") or {}
+        agent_reply = final_state.get("drafted_answer")
+        if manager_decision.get("decision") == "send" and agent_reply:
+            save_message(thread_id, original_email['sender'], "agent", agent_reply, answers=answered_message_ids)
+            print("✅ Agent's reply saved to database.")
+        else:
+            # escalated (flagged, rejected or timed out): a human takes it from here, and
+            # the message must not be merged into, and re-flag, every later question
+            mark_messages_handled(thread_id, answered_message_ids)
+            print("📌 Escalated messages marked as handled.")
+
+    # 4. The run is finished, so its checkpoints are no longer needed
+    if checkpointer:
+        checkpointer.delete_thread(config["configurable"]["thread_id"])
+
+    print("\n--- Workflow Complete ---")
+    return final_state
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import uuid
+import queue
+import boto3
+
+# a job that fails this many times is moved to a dead-letter store instead of
+# being retried again. SQS queues use their redrive policy for the same thing.
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "3"))
+
+
+class SQSJobQueue:
+    """
+    Reads agent jobs from an SQS queue using long polling.
+
+    Jobs that are not acknowledged become visible again once their visibility
+    timeout expires, exactly as they would for the agent Lambda.
+    """
+
+    def __init__(self, queue_url, wait_seconds=20):
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self._client = boto3.client('sqs')
+
+    def receive(self, max_messages):
+        """Waits up to wait_seconds for jobs and returns a list of (receipt, job) pairs."""
+        response = self._client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=self.wait_seconds
+        )
+        return [(m['ReceiptHandle'], json.loads(m['Body'])) for m in response.get('Messages', [])]
+
+    def ack(self, receipt):
+        """Deletes a job that was processed."""
+        self._client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def nack(self, receipt):
+        """Makes a failed job visible again straight away. The queue's redrive policy dead-letters it."""
+        self._client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=0)
+
+    def put(self, job):
+        """Adds a job to the queue."""
+        self._client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+
+class FileJobQueue:
+    """
+    A directory-backed stand-in for SQS, for running and benchmarking workers locally.
+
+    Each job is a JSON file in 'pending/' holding the job and its failed
+    attempts so far. A worker claims a job by renaming it into 'inflight/',
+    which is atomic, so several worker processes can share one directory.
+    Acknowledged jobs are deleted; failed ones are moved back, or into
+    'failed/' once they have failed max_attempts times.
+    """
+
+    def __init__(self, path, wait_seconds=20, poll_interval=0.5, max_attempts=MAX_JOB_ATTEMPTS):
+        self.pending_dir = os.path.join(path, "pending")
+        self.inflight_dir = os.path.join(path, "inflight")
+        self.failed_dir = os.path.join(path, "failed")
+        # jobs are written here first, so 'pending/' only ever holds complete files
+        self.tmp_dir = os.path.join(path, "tmp")
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        for directory in (self.pending_dir, self.inflight_dir, self.failed_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def receive(self, max_messages):
+        """Waits up to wait_seconds for jobs and returns a list of (receipt, job) pairs."""
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            claimed = []
+            for name in sorted(os.listdir(self.pending_dir)):
+                if len(claimed) >= max_messages:
+                    break
+                if not name.endswith(".json"):
+                    continue
+                receipt = os.path.join(self.inflight_dir, name)
+                try:
+                    os.rename(os.path.join(self.pending_dir, name), receipt)
+                except FileNotFoundError:
+                    continue  # claimed by another worker first
+                with open(receipt, "r") as f:
+                    claimed.append((receipt, json.load(f)["job"]))
+            if claimed or time.monotonic() >= deadline:
+                return claimed
+            time.sleep(self.poll_interval)
+
+    def ack(self, receipt):
+        """Deletes a job that was processed."""
+        os.remove(receipt)
+
+    def nack(self, receipt):
+        """Moves a failed job back to 'pending/', or to 'failed/' once it has used up its attempts."""
+        name = os.path.basename(receipt)
+        with open(receipt, "r") as f:
+            envelope = json.load(f)
+        envelope["attempts"] += 1
+        if envelope["attempts"] >= self.max_attempts:
+            print(f"☠️ Job {name} failed {envelope['attempts']} time(s). Moving it to {self.failed_dir}.")
+            self._write(envelope, self.failed_dir, name)
+        else:
+            self._write(envelope, self.pending_dir, name)
+        os.remove(receipt)
+
+    def put(self, job):
+        """Adds a job to the queue. File names sort in the order jobs were added."""
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+        self._write({"job": job, "attempts": 0}, self.pending_dir, name)
+
+    def _write(self, envelope, directory, name):
+        """Writes a job file through 'tmp/', so it appears in the directory complete."""
+        tmp_path = os.path.join(self.tmp_dir, name)
+        with open(tmp_path, "w") as f:
+            json.dump(envelope, f)
+        os.rename(tmp_path, os.path.join(directory, name))
+
+
+class LocalJobQueue:
+    """
+    An in-process queue with the same interface, for benchmarks and local runs in a single process.
+
+    Jobs that fail max_attempts times are kept in 'failed' instead of being retried.
+    """
+
+    def __init__(self, wait_seconds=1, max_attempts=MAX_JOB_ATTEMPTS):
+        self.wait_seconds = wait_seconds
+        self.max_attempts = max_attempts
+        self.failed = []
+        self._queue = queue.Queue()
+
+    def receive(self, max_messages):
+        """Waits up to wait_seconds for the first job, then takes any others already queued."""
+        try:
+            jobs = [self._queue.get(timeout=self.wait_seconds)]
+        except queue.Empty:
+            return []
+        while len(jobs) < max_messages:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # the receipt is the job's envelope, which carries its attempt count
+        return [(envelope, envelope["job"]) for envelope in jobs]
+
+    def ack(self, receipt):
+        """Nothing to do; the job was removed when it was received."""
+
+    def nack(self, receipt):
+        """Puts a failed job back on the queue, or into 'failed' once it has used up its attempts."""
+        receipt["attempts"] += 1
+        if receipt["attempts"] >= self.max_attempts:
+            print(f"☠️ Job failed {receipt['attempts']} time(s). Dropping it to the failed list.")
+            self.failed.append(receipt["job"])
+        else:
+            self._queue.put(receipt)
+
+    def put(self, job):
+        """Adds a job to the queue."""
+        self._queue.put({"job": job, "attempts": 0})
+
+    def empty(self):
+        """Returns True if no jobs are waiting."""
+        return self._queue.empty()
@@ -0,0 +1,291 @@
+import os
+import re
+import math
+import threading
+from collections import OrderedDict
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext
+from src.memmap_vector_store import MemmapVectorStore, METADATA_FILE
+
+# every knowledge base served by this deployment. An email is routed to a
+# knowledge base by a plus-alias on the recipient (e.g. support+485@...) or a
+# tag in its subject (e.g. "[485] Work rights question").
+KNOWLEDGE_BASES = {
+    "485": {
+        "collection": "visa_agent_collection",
+        "files": ["./data/485Visa.md"],
+        "aliases": ["485", "graduate"],
+        "subject_tags": ["485"],
+    },
+}
+DEFAULT_KNOWLEDGE_BASE = "485"
+
+# which vector store backs the knowledge bases: "chroma" for a ChromaDB
+# PersistentClient, or "memmap" for the compact memory-mapped NumPy store that
+# suits small corpora.
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+
+# both stores are built in the temp folder by default (used in serverless Lambda)
+CHROMA_PATH = os.getenv("CHROMA_PATH", "/tmp/chroma_db")
+MEMMAP_PATH = os.getenv("MEMMAP_PATH", "/tmp/memmap_kb")
+# memmap stores built ahead of time by build_knowledge_base.py and shipped in the
+# image. A knowledge base with a store here is opened read-only instead of being
+# embedded again in MEMMAP_PATH on every cold start.
+PREBUILT_MEMMAP_PATH = os.getenv(
+    "PREBUILT_MEMMAP_PATH",
+    # the image's task root on Lambda, otherwise the repository root, whatever the working directory
+    os.path.join(os.getenv("LAMBDA_TASK_ROOT", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "kb_store"),
+)
+
+# upper bound on the estimated memory held by loaded indexes in one container.
+# For chroma this is also handed to Chroma's own LRU segment cache, since the
+# shared client keeps segments loaded regardless of what IndexCache drops.
+MAX_INDEX_MEMORY_MB = float(os.getenv("MAX_INDEX_MEMORY_MB", "256"))
+
+_SUBJECT_TAG = re.compile(r"\[([^\]]+)\]")
+_PLUS_ALIAS = re.compile(r"\+([^@>\s]+)@")
+
+_chroma_client = None
+
+
+def _get_chroma_client():
+    """Returns the container-wide ChromaDB client, creating it on first use."""
+    global _chroma_client
+    if _chroma_client is None:
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+        # let chroma unload the least recently used segments once the budget is reached
+        _chroma_client = chromadb.PersistentClient(
+            path=CHROMA_PATH,
+            settings=ChromaSettings(
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=int(MAX_INDEX_MEMORY_MB * 1024 * 1024),
+            ),
+        )
+    return _chroma_client
+
+
+def _get_cosine_collection(name: str):
+    """
+    Returns a chroma collection that ranks by cosine distance, creating it if needed.
+
+    Chroma defaults to L2 distance, whose scores the retrieval thresholds were
+    not written for. A collection created with L2 is dropped and recreated, so
+    load_index ingests it again.
+    """
+    client = _get_chroma_client()
+    collection = client.get_or_create_collection(name, metadata={"hnsw:space": "cosine"})
+    if (collection.metadata or {}).get("hnsw:space") != "cosine":
+        print(f"♻️ Collection '{name}' does not use cosine distance. Recreating it.")
+        client.delete_collection(name)
+        collection = client.create_collection(name, metadata={"hnsw:space": "cosine"})
+    return collection
+
+
+def cosine_similarity(score, backend=VECTOR_STORE_BACKEND):
+    """
+    Converts a retrieval score from a vector store backend into a cosine similarity.
+
+    The memmap store already scores by cosine similarity. llama-index reports a
+    chroma match as exp(-distance), and a cosine collection's distance is
+    1 - cosine, so the similarity is 1 + ln(score).
+
+    Args:
+        score (float): A node score from the retriever, or None.
+        backend (str): The backend that produced the score.
+
+    Returns:
+        float: The cosine similarity, between -1 and 1, or None.
+    """
+    if score is None or backend != "chroma":
+        return score
+    if score <= 0:
+        return -1.0
+    return max(-1.0, min(1.0, 1.0 + math.log(score)))
+
+
+def resolve_knowledge_base(original_email: dict) -> str:
+    """
+    Picks the knowledge base that should answer an email.
+
+    The recipient's plus-alias is checked first, then any "[tag]" in the
+    subject. Emails that match neither are answered from the default
+    knowledge base.
+
+    Args:
+        original_email (dict): The email being answered, as produced by
+                               get_latest_email.
+
+    Returns:
+        str: The name of a knowledge base in KNOWLEDGE_BASES.
+    """
+    aliases = [alias.lower() for alias in _PLUS_ALIAS.findall(original_email.get("to", ""))]
+    tags = [tag.strip().lower() for tag in _SUBJECT_TAG.findall(original_email.get("subject", ""))]
+
+    for name, config in KNOWLEDGE_BASES.items():
+        if any(alias in config["aliases"] for alias in aliases):
+            return name
+    for name, config in KNOWLEDGE_BASES.items():
+        if any(tag in config["subject_tags"] for tag in tags):
+            return name
+    return DEFAULT_KNOWLEDGE_BASE
+
+
+def _estimate_collection_bytes(collection) -> int:
+    """
+    Estimates the memory a loaded collection occupies from a small sample.
+
+    Each entry is counted as its float32 embedding plus its stored text, which
+    is what dominates the footprint of an HNSW index and its document store.
+    """
+    count = collection.count()
+    if count == 0:
+        return 0
+    sample = collection.peek(limit=10)
+    embeddings = sample.get("embeddings")
+    documents = sample.get("documents") or []
+    dim = len(embeddings[0]) if embeddings is not None and len(embeddings) else 0
+    avg_text = sum(len(doc or "") for doc in documents) / max(len(documents), 1)
+    return int(count * (dim * 4 + avg_text))
+
+
+def _open_vector_store(config: dict):
+    """
+    Opens the vector store for a knowledge base using the configured backend.
+
+    ChromaDB is imported lazily so containers on the memmap backend never pay
+    for its import.
+
+    Returns:
+        tuple: The vector store, its entry count and its estimated size in bytes.
+    """
+    if VECTOR_STORE_BACKEND == "memmap":
+        persist_dir = os.path.join(PREBUILT_MEMMAP_PATH, config["collection"])
+        if not os.path.exists(os.path.join(persist_dir, METADATA_FILE)):
+            persist_dir = os.path.join(MEMMAP_PATH, config["collection"])
+        vector_store = MemmapVectorStore(persist_dir=persist_dir)
+        return vector_store, vector_store.count, vector_store.nbytes
+
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+    chroma_collection = _get_cosine_collection(config["collection"])
+    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+    return vector_store, chroma_collection.count, lambda: _estimate_collection_bytes(chroma_collection)
+
+
+def load_index(name: str):
+    """
+    Loads the vector index for a knowledge base, ingesting its files if the collection is empty.
+
+    Args:
+        name (str): The name of a knowledge base in KNOWLEDGE_BASES.
+
+    Returns:
+        tuple: The VectorStoreIndex and its estimated size in bytes.
+    """
+    config = KNOWLEDGE_BASES[name]
+    vector_store, count, size = _open_vector_store(config)
+
+    # initialize the documents if no vector database is found
+    if count() == 0:
+        print(f"📄 Collection '{config['collection']}' is empty. Ingesting new documents.")
+        index = _ingest(config, vector_store)
+    else: # if the collection already exists
+        print(f"✅ Loading index from existing {VECTOR_STORE_BACKEND} collection '{config['collection']}'.")
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
+
+    return index, size()
+
+
+def _ingest(config: dict, vector_store):
+    """Embeds a knowledge base's files into an empty vector store and returns the index."""
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    documents = SimpleDirectoryReader(input_files=config["files"]).load_data()
+    index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
+    print("✅ Index created and stored successfully.")
+    return index
+
+
+def build_memmap_store(name: str, persist_dir: str):
+    """
+    Builds the memmap store of a knowledge base ahead of time, e.g. for shipping in the image.
+
+    Args:
+        name (str): The name of a knowledge base in KNOWLEDGE_BASES.
+        persist_dir (str): The directory to write the store to.
+
+    Returns:
+        int: The number of chunks in the store.
+    """
+    vector_store = MemmapVectorStore(persist_dir=persist_dir)
+    if vector_store.count():
+        print(f"✅ '{name}' is already built in {persist_dir}.")
+    else:
+        _ingest(KNOWLEDGE_BASES[name], vector_store)
+    return vector_store.count()
+
+
+class IndexCache:
+    """
+    A memory-bounded LRU of loaded knowledge base indexes.
+
+    Indexes are loaded lazily on first use. When the estimated memory of all
+    loaded indexes exceeds the budget, the least recently used ones are dropped
+    until it fits again. The most recently used index is always kept, even if
+    it is larger than the budget on its own.
+
+    Dropping a memmap index releases its mapping. Dropping a chroma index only
+    releases the LlamaIndex wrapper; the segments stay in the shared client
+    and are bounded by its own LRU segment cache instead.
+
+    A slow load (which may embed a whole corpus) only blocks other requests
+    for the same knowledge base, not cache hits for the others.
+    """
+
+    def __init__(self, max_bytes=int(MAX_INDEX_MEMORY_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _lookup(self, name: str):
+        """Returns a loaded index and marks it recently used, or None. Called under the cache lock."""
+        if name in self._indexes:
+            self._indexes.move_to_end(name)
+            return self._indexes[name][0]
+        return None
+
+    def get(self, name: str):
+        """Returns the index for a knowledge base, loading it if needed."""
+        with self._lock:
+            index = self._lookup(name)
+            if index is not None:
+                return index
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            # another thread may have loaded it while this one waited
+            with self._lock:
+                index = self._lookup(name)
+                if index is not None:
+                    return index
+
+            index, size = load_index(name)
+            print(f"📚 Knowledge base '{name}' loaded (~{size / 1024 / 1024:.1f} MB).")
+
+            with self._lock:
+                self._indexes[name] = (index, size)
+                while self.total_bytes() > self.max_bytes and len(self._indexes) > 1:
+                    evicted, (_, evicted_size) = self._indexes.popitem(last=False)
+                    print(f"♻️ Evicted knowledge base '{evicted}' (~{evicted_size / 1024 / 1024:.1f} MB).")
+            return index
+
+    def total_bytes(self) -> int:
+        """Returns the estimated memory held by all loaded indexes."""
+        return sum(size for _, size in self._indexes.values())
+
+    def memory_usage(self) -> dict:
+        """Returns the estimated memory of each loaded index, keyed by knowledge base name."""
+        return {name: size for name, (_, size) in self._indexes.items()}
+
+
+# shared by every graph built in this container.
+index_cache = IndexCache()
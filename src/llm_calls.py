@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from llama_index.core import Settings
+
+# default per-node deadlines (in seconds) used when build_graph is not given any.
+DEFAULT_NODE_DEADLINES = {
+    "guardrail": 20.0,
+    "customer_agent": 45.0,
+    "manager_agent": 30.0,
+}
+
+# hedge delay used until enough latency samples have been collected for a node.
+DEFAULT_HEDGE_AFTER = 5.0
+
+# client-side timeout for a single LLM request. A call abandoned at its deadline
+# keeps its pool thread until the request returns, so this bounds how long that is.
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60"))
+
+# threads kept free on top of two per concurrent job (a primary call and its
+# hedge), for abandoned calls that are still waiting on their timeout.
+LLM_POOL_HEADROOM = 4
+
+# shared pool for all LLM calls in this container. LLM calls are I/O bound, so a
+# small pool is enough to run a primary call and its hedge side by side.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-call")
+_executor_lock = threading.Lock()
+
+
+def size_llm_pool(concurrent_jobs):
+    """
+    Resizes the shared LLM call pool for the number of jobs running at once.
+
+    Each job makes one call at a time, plus a hedge, so a pool smaller than
+    twice the job concurrency leaves calls queued behind each other and their
+    deadlines run out before they even start.
+
+    Args:
+        concurrent_jobs (int): How many jobs this process runs concurrently.
+    """
+    global _executor
+    max_workers = max(8, 2 * concurrent_jobs + LLM_POOL_HEADROOM)
+    with _executor_lock:
+        previous, _executor = _executor, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+    # calls already running on the old pool finish there
+    previous.shutdown(wait=False)
+    print(f"🧵 LLM call pool sized to {max_workers} thread(s).")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an LLM call does not complete within its node's deadline."""
+
+    def __init__(self, node_name, deadline):
+        super().__init__(f"'{node_name}' did not complete within {deadline:.1f}s.")
+        self.node_name = node_name
+        self.deadline = deadline
+
+
+class LatencyTracker:
+    """
+    Keeps a rolling window of observed LLM latencies for each node.
+
+    The p95 of this window is used as the hedge delay, so a second request is
+    only fired for calls that are already slower than almost all recent ones.
+    """
+
+    def __init__(self, window_size=200, min_samples=20):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, node_name, seconds):
+        """Records the latency of a completed call for the given node."""
+        with self._lock:
+            samples = self._samples.setdefault(node_name, deque(maxlen=self.window_size))
+            samples.append(seconds)
+
+    def p95(self, node_name, default=DEFAULT_HEDGE_AFTER):
+        """Returns the p95 latency for a node, or the default if too few samples exist."""
+        with self._lock:
+            samples = sorted(self._samples.get(node_name, ()))
+        if len(samples) < self.min_samples:
+            return default
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+latency_tracker = LatencyTracker()
+
+
+def _timed_complete(llm, prompt, node_name):
+    """Runs a single completion and records its latency."""
+    start = time.monotonic()
+    response = llm.complete(prompt)
+    latency_tracker.record(node_name, time.monotonic() - start)
+    return response
+
+
+def complete_with_deadline(prompt, node_name, deadline=None, hedge=False, llm=None):
+    """
+    Calls the LLM with an optional deadline and optional request hedging.
+
+    When hedging is enabled and the first call has not returned after the node's
+    p95 latency, a second identical call is fired. Whichever call finishes first
+    is returned and the other one is cancelled. A call that has already started
+    cannot be interrupted, so a losing request is left to finish in the
+    background and its result is discarded.
+
+    Args:
+        prompt (str): The fully formatted prompt to send.
+        node_name (str): The graph node making the call, used for latency tracking.
+        deadline (float, optional): Maximum number of seconds to wait for a result.
+                                    Waits indefinitely if None.
+        hedge (bool): Whether to fire a hedged second request for slow calls.
+        llm (LLM, optional): The LLM to call. Defaults to Settings.llm.
+
+    Returns:
+        CompletionResponse: The first response returned by the LLM.
+
+    Raises:
+        DeadlineExceeded: If no response arrives before the deadline.
+    """
+    llm = llm or Settings.llm
+    executor = _executor
+    start = time.monotonic()
+    futures = [executor.submit(_timed_complete, llm, prompt, node_name)]
+
+    def remaining():
+        if deadline is None:
+            return None
+        return max(0.0, deadline - (time.monotonic() - start))
+
+    try:
+        if hedge:
+            hedge_after = latency_tracker.p95(node_name)
+            if deadline is not None:
+                hedge_after = min(hedge_after, deadline)
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done and (deadline is None or remaining() > 0):
+                print(f"⏱️ '{node_name}' slower than {hedge_after:.1f}s. Firing hedged request.")
+                futures.append(executor.submit(_timed_complete, llm, prompt, node_name))
+
+        pending = list(futures)
+        while pending:
+            done, not_done = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                # a failed attempt only matters if there is no other attempt left.
+                if future.exception() is None:
+                    return future.result()
+            pending = list(not_done)
+            if not pending:
+                raise next(iter(done)).exception()
+
+        print(f"❌ '{node_name}' exceeded its deadline of {deadline:.1f}s.")
+        raise DeadlineExceeded(node_name, deadline)
+    finally:
+        for future in futures:
+            future.cancel()
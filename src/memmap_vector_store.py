@@ -0,0 +1,178 @@
+import os
+import json
+from typing import Any, List
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore, FilterCondition, FilterOperator, MetadataFilters, VectorStoreQuery, VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict, metadata_dict_to_node
+
+EMBEDDINGS_FILE = "embeddings.f32"
+METADATA_FILE = "metadata.json"
+
+# metadata filter operators, applied to a stored value and the filter's value.
+_FILTER_OPERATORS = {
+    FilterOperator.EQ: lambda stored, value: stored == value,
+    FilterOperator.NE: lambda stored, value: stored != value,
+    FilterOperator.IN: lambda stored, value: stored in value,
+    FilterOperator.NIN: lambda stored, value: stored not in value,
+    FilterOperator.GT: lambda stored, value: stored is not None and stored > value,
+    FilterOperator.GTE: lambda stored, value: stored is not None and stored >= value,
+    FilterOperator.LT: lambda stored, value: stored is not None and stored < value,
+    FilterOperator.LTE: lambda stored, value: stored is not None and stored <= value,
+}
+
+
+def _matches(metadata: dict, filters: MetadataFilters) -> bool:
+    """Returns True if a node's stored metadata satisfies the (possibly nested) filters."""
+    results = []
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            results.append(_matches(metadata, metadata_filter))
+            continue
+        compare = _FILTER_OPERATORS.get(metadata_filter.operator)
+        if compare is None:
+            raise ValueError(f"MemmapVectorStore does not support the '{metadata_filter.operator}' filter operator.")
+        results.append(compare(metadata.get(metadata_filter.key), metadata_filter.value))
+
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    if filters.condition == FilterCondition.NOT:
+        return not any(results)
+    return all(results)
+
+
+class MemmapVectorStore(BasePydanticVectorStore):
+    """
+    A compact vector store for small knowledge bases.
+
+    All chunk embeddings live in one contiguous float32 matrix that is stored as
+    a raw file and memory-mapped on load, with the node ids, text and metadata
+    in a sidecar JSON file. Embeddings are normalised when written, so a query
+    is a single matrix-vector product followed by an exact top-k selection.
+
+    Attributes:
+        persist_dir (str): The directory holding the matrix and metadata files.
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+
+    _embeddings: Any = PrivateAttr(default=None)
+    _records: List[dict] = PrivateAttr(default_factory=list)
+
+    def __init__(self, persist_dir: str, **kwargs: Any) -> None:
+        super().__init__(persist_dir=persist_dir, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def client(self) -> None:
+        """There is no underlying client; the files are read directly."""
+        return None
+
+    def _load(self) -> None:
+        """Memory-maps the embedding matrix and reads the sidecar metadata, if present."""
+        metadata_path = os.path.join(self.persist_dir, METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            self._embeddings, self._records = None, []
+            return
+
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        self._records = metadata["records"]
+        self._embeddings = None
+        if self._records:
+            self._embeddings = np.memmap(
+                os.path.join(self.persist_dir, EMBEDDINGS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self._records), metadata["dim"]),
+            )
+
+    def _persist(self, embeddings: np.ndarray, records: List[dict]) -> None:
+        """Atomically rewrites the matrix and metadata files, then re-maps them."""
+        embeddings_path = os.path.join(self.persist_dir, EMBEDDINGS_FILE)
+        metadata_path = os.path.join(self.persist_dir, METADATA_FILE)
+
+        np.ascontiguousarray(embeddings, dtype=np.float32).tofile(embeddings_path + ".tmp")
+        with open(metadata_path + ".tmp", "w") as f:
+            json.dump({"dim": int(embeddings.shape[1]) if len(records) else 0, "records": records}, f)
+
+        # release the old mapping before the file underneath it is replaced.
+        self._embeddings = None
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+        self._load()
+
+    def count(self) -> int:
+        """Returns the number of stored chunks."""
+        return len(self._records)
+
+    def nbytes(self) -> int:
+        """Returns the size of the embedding matrix plus the stored text, in bytes."""
+        matrix = self._embeddings.nbytes if self._embeddings is not None else 0
+        return matrix + sum(len(record["node"].get("_node_content", "")) for record in self._records)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Appends nodes and their normalised embeddings to the store."""
+        if not nodes:
+            return []
+
+        new_embeddings = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        norms = np.linalg.norm(new_embeddings, axis=1, keepdims=True)
+        new_embeddings /= np.where(norms == 0, 1, norms)
+
+        new_records = [
+            {
+                "id": node.node_id,
+                "ref_doc_id": node.ref_doc_id,
+                "node": node_to_metadata_dict(node, remove_text=False, flat_metadata=False),
+            }
+            for node in nodes
+        ]
+
+        if self._embeddings is not None:
+            new_embeddings = np.vstack([np.asarray(self._embeddings), new_embeddings])
+        self._persist(new_embeddings, self._records + new_records)
+        return [record["id"] for record in new_records]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Removes every node that belongs to the given source document."""
+        keep = [i for i, record in enumerate(self._records) if record["ref_doc_id"] != ref_doc_id]
+        if len(keep) == len(self._records):
+            return
+        embeddings = np.asarray(self._embeddings)[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+        self._persist(embeddings, [self._records[i] for i in keep])
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Returns the top-k nodes by cosine similarity, using an exact search."""
+        if self._embeddings is None or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_embedding = np.asarray(query.query_embedding, dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
+        scores = self._embeddings @ query_embedding
+
+        # restrict the search to specific documents, nodes or metadata when asked to.
+        if query.doc_ids or query.node_ids or query.filters:
+            allowed = np.array([
+                (not query.doc_ids or record["ref_doc_id"] in query.doc_ids)
+                and (not query.node_ids or record["id"] in query.node_ids)
+                and (not query.filters or _matches(record["node"], query.filters))
+                for record in self._records
+            ])
+            scores = np.where(allowed, scores, -np.inf)
+
+        k = min(query.similarity_top_k, len(self._records))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = [i for i in top if np.isfinite(scores[i])]
+
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(self._records[i]["node"]) for i in top],
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._records[i]["id"] for i in top],
+        )
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from functools import lru_cache
+from llama_index.llms.gemini import Gemini
+from src.llm_calls import complete_with_deadline, LLM_REQUEST_TIMEOUT_SECONDS
+
+LIGHT_MODEL = os.getenv("LIGHT_MODEL", "models/gemini-2.5-flash-lite")
+HEAVY_MODEL = os.getenv("HEAVY_MODEL", "models/gemini-2.5-flash")
+
+# the model each node uses on each route, overridable per node in build_graph.
+DEFAULT_NODE_MODELS = {
+    "guardrail": {"light": LIGHT_MODEL, "heavy": HEAVY_MODEL},
+    "customer_agent": {"light": LIGHT_MODEL, "heavy": HEAVY_MODEL},
+    "manager_agent": {"light": LIGHT_MODEL, "heavy": HEAVY_MODEL},
+}
+
+
+@lru_cache(maxsize=None)
+def get_llm(model_name):
+    """Returns the LLM client for a model, creating one per model per container."""
+    return Gemini(model=model_name, request_options={"timeout": LLM_REQUEST_TIMEOUT_SECONDS})
+
+
+class ModelRouter:
+    """
+    Sends simple questions to a lighter, faster model and hard ones to the heavier model.
+
+    A question is routed 'heavy' when it is long, when the thread already has a
+    long history, when the guardrail judged it complex, or when retrieval found
+    nothing that matches it closely. Everything else is routed 'light'.
+
+    The router also keeps per-route counters (calls, latency and, for whole
+    runs, how often they ended in escalation) so the trade-off can be checked.
+
+    Args:
+        node_models (dict, optional): Overrides for DEFAULT_NODE_MODELS, keyed by node name.
+        max_light_question_chars (int): Longest question that may use the light model.
+        max_light_history_lines (int): Longest chat history that may use the light model.
+        min_light_retrieval_score (float): Lowest top retrieval cosine similarity that may use the light model.
+        prompt_cache (PromptCache, optional): Sends the static prefix of each prompt
+                                              through a provider-side cached context.
+    """
+
+    def __init__(self, node_models=None, max_light_question_chars=600, max_light_history_lines=4, min_light_retrieval_score=0.75, prompt_cache=None):
+        self.node_models = {**DEFAULT_NODE_MODELS, **(node_models or {})}
+        self.prompt_cache = prompt_cache
+        self.max_light_question_chars = max_light_question_chars
+        self.max_light_history_lines = max_light_history_lines
+        self.min_light_retrieval_score = min_light_retrieval_score
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._outcomes = {}
+
+    def choose_route(self, node_name, state):
+        """Returns 'light' or 'heavy' for a node, given what is known about the request so far."""
+        if len(state.get("question", "")) > self.max_light_question_chars:
+            return "heavy"
+        if len((state.get("chat_history") or "").splitlines()) > self.max_light_history_lines:
+            return "heavy"
+
+        guard_decision = state.get("guardrail_decision")
+        if guard_decision is not None and guard_decision.complexity != "simple":
+            return "heavy"
+
+        scores = [score for score in state.get("retrieval_scores") or [] if score is not None]
+        if node_name != "guardrail" and (not scores or max(scores) < self.min_light_retrieval_score):
+            return "heavy"
+        return "light"
+
+    def model_for(self, node_name, state):
+        """Returns the model a node's call would be routed to for the given state."""
+        return self.node_models[node_name][self.choose_route(node_name, state)]
+
+    def complete(self, prompt, node_name, state, deadline=None, hedge=False):
+        """
+        Completes a prompt on the routed model and records the call's latency.
+
+        Returns:
+            tuple: The route taken and the LLM response.
+        """
+        route = self.choose_route(node_name, state)
+        model = self.node_models[node_name][route]
+        print(f"🧭 '{node_name}' routed to {route} model {model}.")
+
+        llm = get_llm(model)
+        if self.prompt_cache:
+            llm = self.prompt_cache.wrap(model, llm)
+
+        start = time.monotonic()
+        try:
+            # latency is tracked per route so each model hedges against its own p95
+            response = complete_with_deadline(prompt, f"{node_name}:{route}", deadline=deadline, hedge=hedge, llm=llm)
+        finally:
+            self._record_call(node_name, route, time.monotonic() - start)
+        return route, response
+
+    def _record_call(self, node_name, route, seconds):
+        with self._lock:
+            count, total = self._calls.get((node_name, route), (0, 0.0))
+            self._calls[(node_name, route)] = (count + 1, total + seconds)
+
+    def record_outcome(self, model_routes, escalated):
+        """Records whether a run that took the given per-node routes ended in escalation."""
+        # runs are grouped by the drafting route, or the guardrail route if they never got that far
+        node = "customer_agent" if "customer_agent" in model_routes else "guardrail"
+        key = f"{node}:{model_routes.get(node, 'unrouted')}"
+        with self._lock:
+            runs, escalations = self._outcomes.get(key, (0, 0))
+            self._outcomes[key] = (runs + 1, escalations + int(escalated))
+        print(f"📊 Routing stats: {self.stats()}")
+
+    def stats(self):
+        """Returns per-route call counts, mean latency and escalation rates."""
+        with self._lock:
+            calls = {
+                f"{node}:{route}": {"calls": count, "mean_latency_s": round(total / count, 3)}
+                for (node, route), (count, total) in self._calls.items()
+            }
+            outcomes = {
+                key: {"runs": runs, "escalation_rate": round(escalations / runs, 3)}
+                for key, (runs, escalations) in self._outcomes.items()
+            }
+        return {"calls": calls, "outcomes": outcomes}
@@ -0,0 +1,168 @@
+import re
+from llama_index.core import Settings
+
+# default number of context tokens each node may put into its prompt.
+DEFAULT_CONTEXT_BUDGETS = {
+    "customer_agent": 1500,
+    "manager_agent": 1000,
+}
+
+# word n-gram size used to compare chunks with each other and with the draft.
+SHINGLE_SIZE = 3
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens in a piece of text using LlamaIndex's global tokenizer.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The number of tokens in the text.
+    """
+    return len(Settings.tokenizer(text))
+
+
+def _shingles(text: str) -> set:
+    """Returns the set of lower-cased word n-grams in the text."""
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def dedupe_chunks(chunks: list, max_overlap: float = 0.8) -> list:
+    """
+    Removes chunks whose content is already covered by a higher-ranked chunk.
+
+    Retrieval often returns neighbouring chunks that share a large overlapping
+    window of text. A chunk is dropped when at least `max_overlap` of its word
+    n-grams already appear in the chunks kept so far.
+
+    Args:
+        chunks (list): Chunk texts, ordered from most to least relevant.
+        max_overlap (float): The fraction of shared n-grams above which a chunk
+                             is treated as a duplicate.
+
+    Returns:
+        list: The chunks that add new content, in their original order.
+    """
+    kept, seen = [], set()
+    for chunk in chunks:
+        shingles = _shingles(chunk)
+        if not shingles:
+            continue
+        if len(shingles & seen) / len(shingles) >= max_overlap:
+            continue
+        kept.append(chunk)
+        seen |= shingles
+    return kept
+
+
+def fit_to_budget(chunks: list, max_tokens: int) -> list:
+    """
+    Trims a list of chunks so their combined size stays within a token budget.
+
+    Chunks are added in order until the budget is reached. The chunk that
+    crosses the budget is cut back to whole sentences that still fit, and
+    everything after it is dropped. If not even one sentence of the top-ranked
+    chunk fits, it is cut off mid-sentence instead, so the most relevant chunk
+    is never lost.
+
+    Args:
+        chunks (list): Chunk texts, ordered from most to least relevant.
+        max_tokens (int): The maximum number of tokens for all chunks together.
+
+    Returns:
+        list: The chunks that fit within the budget.
+    """
+    fitted, used = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk)
+        if used + tokens <= max_tokens:
+            fitted.append(chunk)
+            used += tokens
+            continue
+
+        # keep as many leading sentences of the overflowing chunk as will fit.
+        sentences = []
+        for sentence in _SENTENCE_SPLIT.split(chunk):
+            sentence_tokens = count_tokens(sentence)
+            if used + sentence_tokens > max_tokens:
+                break
+            sentences.append(sentence)
+            used += sentence_tokens
+        if sentences:
+            fitted.append(" ".join(sentences))
+        elif not fitted:
+            truncated = _truncate_to_tokens(chunk, max_tokens - used)
+            if truncated:
+                fitted.append(truncated)
+        break
+    return fitted
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Returns the longest run of leading words of the text that fits in max_tokens."""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def select_supporting_chunks(chunks: list, drafted_answer: str, min_overlap: float = 0.05, min_shared: int = 2) -> list:
+    """
+    Selects the chunks that the drafted answer actually drew on.
+
+    A chunk counts as supporting when it shares at least `min_shared` word
+    n-grams with the draft and those cover at least `min_overlap` of the
+    draft's n-grams. Overlap is measured against the draft, not the chunk, so
+    a long chunk the draft quotes from is not diluted by its own length. If no
+    chunk reaches the threshold, all chunks are returned so the reviewer is
+    never left without context.
+
+    Args:
+        chunks (list): The chunk texts that were given to the drafting model.
+        drafted_answer (str): The answer produced from those chunks.
+        min_overlap (float): The minimum fraction of the draft's n-grams shared.
+        min_shared (int): The minimum number of shared n-grams.
+
+    Returns:
+        list: The supporting chunks, in their original order.
+    """
+    draft_shingles = _shingles(drafted_answer)
+    if not draft_shingles:
+        return list(chunks)
+    supporting = []
+    for chunk in chunks:
+        shared = len(_shingles(chunk) & draft_shingles)
+        if shared >= min_shared and shared / len(draft_shingles) >= min_overlap:
+            supporting.append(chunk)
+    return supporting or list(chunks)
+
+
+def assemble_context(chunks: list, max_tokens: int) -> list:
+    """
+    De-duplicates and trims retrieved chunks to a node's token budget.
+
+    Args:
+        chunks (list): Chunk texts, ordered from most to least relevant.
+        max_tokens (int): The token budget for the node's context.
+
+    Returns:
+        list: The final chunks to place in the prompt.
+    """
+    before = sum(count_tokens(chunk) for chunk in chunks)
+    assembled = fit_to_budget(dedupe_chunks(chunks), max_tokens)
+    after = sum(count_tokens(chunk) for chunk in assembled)
+    print(f"📏 Context assembled: {len(chunks)} chunk(s), {before} tokens -> {len(assembled)} chunk(s), {after} tokens.")
+    return assembled
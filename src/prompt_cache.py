@@ -0,0 +1,356 @@
+import os
+import time
+import hashlib
+import threading
+from collections import Counter
+from llama_index.core import Settings
+from llama_index.core.base.llms.types import CompletionResponse
+from src.llm_calls import LLM_REQUEST_TIMEOUT_SECONDS
+from src.prompt_assembly import count_tokens
+from src.prompt_templates import SplitPrompt, HotChunkTracker
+
+# how long a provider-side cached context lives, and how close to expiry it is replaced.
+CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+CACHE_REFRESH_MARGIN_SECONDS = 60
+# after caching fails for a model, it is not retried for this long.
+CACHE_RETRY_AFTER_SECONDS = 300
+
+# where cached context names are shared: "postgres" across all containers, or
+# "local" within this process.
+CACHE_REGISTRY_BACKEND = os.getenv("PROMPT_CACHE_REGISTRY", "postgres")
+
+
+class CacheUnavailable(Exception):
+    """Raised by a provider when a prefix cannot be cached (too small, unsupported, quota, ...)."""
+
+
+class LocalCacheRegistry:
+    """
+    Keeps the names of cached contexts in this process.
+
+    Each entry is {'name', 'expires_at'} with expires_at in epoch seconds.
+    Updates of one key are serialised, so only one thread creates its cache.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """Returns the entry for a key, or None."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def update(self, key, compute):
+        """
+        Replaces the entry for a key while holding that key's lock.
+
+        compute receives the current entry (or None) and returns the entry to store.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = compute(self.load(key))
+            with self._lock:
+                self._entries[key] = entry
+            return entry
+
+
+class PostgresCacheRegistry:
+    """
+    Shares the names of cached contexts between containers through the application database.
+
+    Without it every cold container would create its own cached copy of the
+    same prefix. Creation is serialised per key with a transaction-level
+    advisory lock, so while one container creates a cache, only containers
+    that need that same prefix wait, and they then reuse its name.
+    """
+
+    def __init__(self):
+        # imported here so the local registry does not need database secrets
+        from src.database_service import get_db_connection
+        self._connect = get_db_connection
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database unavailable for the prompt cache registry.")
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_caches (
+                    cache_key VARCHAR(255) PRIMARY KEY,
+                    cache_name TEXT NOT NULL,
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+                );
+            """)
+        conn.commit()
+        conn.close()
+
+    def load(self, key):
+        """Returns the {'name', 'expires_at'} entry for a key, or None."""
+        conn = self._connect()
+        if not conn:
+            return None
+        with conn.cursor() as cur:
+            cur.execute("SELECT cache_name, EXTRACT(EPOCH FROM expires_at) FROM prompt_caches WHERE cache_key = %s;", (key,))
+            row = cur.fetchone()
+        conn.close()
+        return {"name": row[0], "expires_at": float(row[1])} if row else None
+
+    def update(self, key, compute):
+        """
+        Replaces the entry for a key while holding an exclusive lock.
+
+        compute receives the current entry (or None) and returns the entry to store.
+        """
+        conn = self._connect()
+        if not conn:
+            return compute(None)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (key,))
+                cur.execute("SELECT cache_name, EXTRACT(EPOCH FROM expires_at) FROM prompt_caches WHERE cache_key = %s;", (key,))
+                row = cur.fetchone()
+                current = {"name": row[0], "expires_at": float(row[1])} if row else None
+                entry = compute(current)
+                if entry is not current:
+                    cur.execute(
+                        """
+                        INSERT INTO prompt_caches (cache_key, cache_name, expires_at) VALUES (%s, %s, to_timestamp(%s))
+                        ON CONFLICT (cache_key) DO UPDATE
+                        SET cache_name = EXCLUDED.cache_name, expires_at = EXCLUDED.expires_at;
+                        """,
+                        (key, entry["name"], entry["expires_at"])
+                    )
+            # committing releases the advisory lock
+            conn.commit()
+        except Exception:
+            # a failed creation must not leave other containers waiting on the lock
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return entry
+
+
+def get_cache_registry():
+    """Returns the registry selected by PROMPT_CACHE_REGISTRY, falling back to this process."""
+    if CACHE_REGISTRY_BACKEND == "postgres":
+        try:
+            return PostgresCacheRegistry()
+        except Exception as e:
+            print(f"❌ Postgres prompt cache registry unavailable ({e}). Caches will not be shared between containers.")
+    return LocalCacheRegistry()
+
+
+class GeminiCacheProvider:
+    """Creates and uses Gemini cached contents through the google-genai SDK."""
+
+    # Gemini rejects cached contents smaller than this.
+    min_prefix_tokens = 1024
+
+    def __init__(self):
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                from google import genai
+                from google.genai import types
+            except ImportError as e:
+                raise CacheUnavailable(f"google-genai is not installed: {e}")
+            # the same request timeout as the LlamaIndex clients, in milliseconds
+            self._client = genai.Client(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                http_options=types.HttpOptions(timeout=int(LLM_REQUEST_TIMEOUT_SECONDS * 1000)),
+            )
+        return self._client
+
+    def create_cache(self, model, prefix, ttl_seconds):
+        """Creates a cached context for the prefix and returns its name."""
+        client = self._get_client()
+        from google.genai import types
+        try:
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(contents=[prefix], ttl=f"{ttl_seconds}s"),
+            )
+        except Exception as e:
+            raise CacheUnavailable(str(e))
+        return cache.name
+
+    def generate(self, model, cache_name, suffix):
+        """Generates from a cached prefix plus the suffix. Returns the text and token usage."""
+        from google.genai import types
+        response = self._get_client().models.generate_content(
+            model=model,
+            contents=suffix,
+            config=types.GenerateContentConfig(cached_content=cache_name),
+        )
+        usage = response.usage_metadata
+        cached = usage.cached_content_token_count or 0
+        return response.text, {"cached": cached, "uncached": (usage.prompt_token_count or 0) - cached}
+
+
+class FakeCacheProvider:
+    """
+    A local stand-in for a caching provider, for tests and offline runs.
+
+    Replies come from a responder function given the full prompt, and token
+    usage is counted by whitespace so cache accounting can be checked.
+    """
+
+    def __init__(self, responder=lambda prompt: "{}", min_prefix_tokens=0):
+        self.responder = responder
+        self.min_prefix_tokens = min_prefix_tokens
+        self.caches = {}
+        self.created = 0
+
+    def create_cache(self, model, prefix, ttl_seconds):
+        self.created += 1
+        name = f"fake-cache-{self.created}"
+        self.caches[name] = prefix
+        return name
+
+    def generate(self, model, cache_name, suffix):
+        prefix = self.caches[cache_name]
+        return self.responder(prefix + suffix), {"cached": len(prefix.split()), "uncached": len(suffix.split())}
+
+
+class PromptCache:
+    """
+    Manages provider-side cached contexts for the static prefixes of prompts.
+
+    One cached context is kept per (model, prefix) and a new one is created
+    shortly before its TTL runs out; the old one is left to expire, since
+    other containers may still be using it. Cache names are kept in a
+    registry, so containers sharing a Postgres registry reuse each other's
+    caches instead of creating their own. Prompts whose prefix is below the
+    provider's minimum cacheable size, and any call where caching fails, fall
+    back to the model's normal uncached completion of the prompt's fallback
+    text. Cached and uncached input tokens are counted for both paths.
+
+    Only customer prompts that carry a knowledge library can reach Gemini's
+    minimum, so the other nodes send plain prompts; use will_cache() to check
+    before building a prompt around caching.
+
+    Args:
+        provider: A GeminiCacheProvider or FakeCacheProvider.
+        ttl_seconds (int): The TTL of each cached context.
+        registry (optional): A PostgresCacheRegistry or LocalCacheRegistry.
+                             Defaults to a LocalCacheRegistry.
+    """
+
+    def __init__(self, provider, ttl_seconds=CACHE_TTL_SECONDS, registry=None):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.registry = registry or LocalCacheRegistry()
+        self.hot_chunks = HotChunkTracker(refresh_seconds=ttl_seconds, count_tokens=count_tokens)
+        self._entries = {}
+        self._unavailable_until = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    @staticmethod
+    def _is_live(entry):
+        """True if a registry entry is valid for longer than the refresh margin."""
+        return entry is not None and entry["expires_at"] - time.time() > CACHE_REFRESH_MARGIN_SECONDS
+
+    def _create_if_stale(self, model, prefix, current):
+        """Called under the registry lock: keeps a live entry, or creates a new cached context."""
+        if self._is_live(current):
+            return current
+        name = self.provider.create_cache(model, prefix, self.ttl_seconds)
+        self._bump("caches_created")
+        return {"name": name, "expires_at": time.time() + self.ttl_seconds}
+
+    def _get_cache_name(self, model, prefix):
+        """Returns a live cached context for the prefix, creating it if no container has one."""
+        key = f"{model}:{hashlib.sha256(prefix.encode()).hexdigest()}"
+        with self._lock:
+            if time.monotonic() < self._unavailable_until.get(model, 0):
+                raise CacheUnavailable(f"Caching for {model} is paused after a recent failure.")
+            entry = self._entries.get(key)
+        if self._is_live(entry):
+            return entry["name"]
+
+        # the provider call happens outside self._lock, so calls for other prefixes are not held up
+        entry = self.registry.load(key)
+        if not self._is_live(entry):
+            try:
+                entry = self.registry.update(key, lambda current: self._create_if_stale(model, prefix, current))
+            except CacheUnavailable:
+                with self._lock:
+                    self._unavailable_until[model] = time.monotonic() + CACHE_RETRY_AFTER_SECONDS
+                raise
+        with self._lock:
+            self._entries[key] = entry
+        return entry["name"]
+
+    def complete(self, model, prompt, fallback_llm):
+        """
+        Completes a prompt, sending its prefix through a cached context when possible.
+
+        Args:
+            model (str): The provider model name.
+            prompt (str): A SplitPrompt, or a plain string that is sent uncached.
+            fallback_llm (LLM): The LlamaIndex LLM used when caching is unavailable.
+
+        Returns:
+            CompletionResponse: The model's response.
+        """
+        if isinstance(prompt, SplitPrompt) and self.will_cache(model, prompt.prefix):
+            try:
+                name = self._get_cache_name(model, prompt.prefix)
+                text, usage = self.provider.generate(model, name, prompt.suffix)
+                self._record(usage["cached"], usage["uncached"])
+                return CompletionResponse(text=text)
+            except CacheUnavailable as e:
+                print(f"⚠️ Prompt caching unavailable, sending uncached: {e}")
+            except Exception as e:
+                print(f"⚠️ Cached generation failed, sending uncached: {e}")
+            self._bump("fallbacks")
+        elif isinstance(prompt, SplitPrompt):
+            self._bump("not_cached")
+
+        text = prompt.fallback if isinstance(prompt, SplitPrompt) else str(prompt)
+        response = fallback_llm.complete(text)
+        self._record(0, len(Settings.tokenizer(text)))
+        return response
+
+    def will_cache(self, model, prefix):
+        """True if a prefix is large enough to cache and caching is not paused for the model."""
+        if not prefix or len(Settings.tokenizer(prefix)) < self.provider.min_prefix_tokens:
+            return False
+        with self._lock:
+            return time.monotonic() >= self._unavailable_until.get(model, 0)
+
+    def _bump(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _record(self, cached, uncached):
+        with self._lock:
+            self._stats["cached_input_tokens"] += cached
+            self._stats["uncached_input_tokens"] += uncached
+        print(f"💾 Input tokens: {cached} cached, {uncached} uncached.")
+
+    def stats(self):
+        """Returns counters of cached and uncached input tokens, caches created, fallbacks and prompts that were not cacheable."""
+        with self._lock:
+            return dict(self._stats)
+
+    def wrap(self, model, llm):
+        """Returns an LLM-like object whose complete() goes through this cache."""
+        return _CachedModel(self, model, llm)
+
+
+class _CachedModel:
+    """Adapts a PromptCache to the llm.complete(prompt) interface used by complete_with_deadline."""
+
+    def __init__(self, prompt_cache, model, llm):
+        self._prompt_cache = prompt_cache
+        self._model = model
+        self._llm = llm
+
+    def complete(self, prompt):
+        return self._prompt_cache.complete(self._model, prompt, self._llm)
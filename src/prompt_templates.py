@@ -0,0 +1,136 @@
+import re
+import time
+import threading
+from collections import Counter
+
+_PLACEHOLDER = re.compile(r"\{[a-z_]+\}")
+
+
+class SplitPrompt(str):
+    """
+    A prompt that knows which part of it is a stable, cacheable prefix.
+
+    It is a plain string (prefix + suffix) for any LLM that does not cache,
+    while a caching model can send the prefix once and only the suffix per call.
+    A prompt whose prefix only makes sense when cached (one that carries a
+    knowledge library) also holds the plain prompt to send when it is not.
+    """
+
+    def __new__(cls, prefix, suffix, fallback=None):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        prompt.fallback = fallback if fallback is not None else prefix + suffix
+        return prompt
+
+
+def split_template(template_str):
+    """
+    Splits a prompt template into its static prefix and its variable suffix.
+
+    The split happens at the start of the paragraph (blank-line separated
+    block) holding the first placeholder, so the prefix holds only static
+    instructions and examples, and every placeholder lives in the suffix.
+
+    Returns:
+        tuple: The static prefix and the template of the suffix.
+    """
+    match = _PLACEHOLDER.search(template_str)
+    if not match:
+        return template_str, ""
+    block_start = template_str.rfind("\n\n", 0, match.start())
+    split_at = 0 if block_start == -1 else block_start + 2
+    return template_str[:split_at], template_str[split_at:]
+
+
+def build_split_prompt(template_str, library_chunks=(), fallback=None, **variables):
+    """
+    Formats a prompt template as a SplitPrompt.
+
+    Any library chunks are appended to the prefix as a numbered
+    <knowledge_library>, so frequently used knowledge is cached along with
+    the instructions.
+
+    Args:
+        template_str (str): The prompt template.
+        library_chunks (list): Knowledge chunks to place in the cached prefix.
+        fallback (str, optional): The prompt to send instead when the prefix
+                                  cannot be cached.
+        **variables: Values for the template's placeholders.
+
+    Returns:
+        SplitPrompt: The formatted prompt.
+    """
+    prefix, suffix_template = split_template(template_str)
+    if library_chunks:
+        entries = "\n\n".join(f"[K{i}]\n{chunk}" for i, chunk in enumerate(library_chunks, start=1))
+        prefix += f"<knowledge_library>\n{entries}\n</knowledge_library>\n\n"
+    # placeholders are only substituted in the suffix; the prefix stays byte-identical across calls
+    suffix = _PLACEHOLDER.sub(lambda m: str(variables.get(m.group(0)[1:-1], m.group(0))), suffix_template)
+    return SplitPrompt(prefix, suffix, fallback)
+
+
+def reference_library_chunks(chunks, library_chunks):
+    """Replaces chunks that are already in the cached knowledge library with a reference to them."""
+    positions = {chunk: i for i, chunk in enumerate(library_chunks, start=1)}
+    return [
+        f"[K{positions[chunk]}] (see <knowledge_library>)" if chunk in positions else chunk
+        for chunk in chunks
+    ]
+
+
+class HotChunkTracker:
+    """
+    Tracks which knowledge chunks are retrieved most often, per knowledge base.
+
+    The set of hot chunks is only recomputed every refresh_seconds, so the
+    cached prefix they belong to stays stable between refreshes.
+
+    Args:
+        count_tokens (callable, optional): Counts the tokens in a chunk for
+                                           max_tokens. Defaults to
+                                           prompt_assembly.count_tokens.
+    """
+
+    def __init__(self, min_hits=3, max_chunks=8, refresh_seconds=3600, count_tokens=None):
+        self.min_hits = min_hits
+        self.max_chunks = max_chunks
+        self.refresh_seconds = refresh_seconds
+        self.count_tokens = count_tokens
+        self._counts = {}
+        self._hot = {}
+        self._lock = threading.Lock()
+
+    def record(self, group, chunks):
+        """Counts one retrieval of each chunk from the given knowledge base."""
+        with self._lock:
+            self._counts.setdefault(group, Counter()).update(chunks)
+
+    def hot_chunks(self, group, max_tokens=None):
+        """
+        Returns the current hot chunks of a knowledge base, in a stable order.
+
+        With max_tokens, only the whole chunks that fit in that many tokens
+        are returned, so the library stays within the node's context budget.
+        """
+        with self._lock:
+            hot, refreshed_at = self._hot.get(group, ([], None))
+            if refreshed_at is None or time.monotonic() - refreshed_at >= self.refresh_seconds:
+                counts = self._counts.get(group, Counter())
+                top = [chunk for chunk, hits in counts.most_common(self.max_chunks) if hits >= self.min_hits]
+                # an empty set is not frozen, so hot chunks appear as soon as any reach min_hits
+                hot = sorted(top)
+                self._hot[group] = (hot, time.monotonic() if hot else None)
+        if max_tokens is None:
+            return list(hot)
+        count_tokens = self.count_tokens
+        if count_tokens is None:
+            # imported here because prompt_assembly counts with LlamaIndex's tokenizer
+            from src.prompt_assembly import count_tokens
+        fitted, used = [], 0
+        for chunk in hot:
+            used += count_tokens(chunk)
+            if used > max_tokens:
+                break
+            fitted.append(chunk)
+        return fitted
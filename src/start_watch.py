@@ -1,9 +1,10 @@
+# Run from the repository root with: python -m src.start_watch
 import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import json
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from src.gmail_service import build_gmail_client
+from src.credentials_service import GmailCredentialsManager, FileTokenCache, seed_token_cache
 
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -22,22 +23,25 @@ def get_local_gmail_service():
     creds = None
     token_file = 'admin_token.json'
     if os.path.exists(token_file):
-        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+        with open(token_file, "r") as f:
+            token_info = json.load(f)
+        if token_info.get("refresh_token"):
+            # reuse the access token cached by earlier runs (or get_token.py) while it is valid
+            manager = GmailCredentialsManager(token_info, SCOPES, FileTokenCache(), background=False)
+            creds = manager.get_credentials()
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "credentials.json", SCOPES
-            )
-            creds = flow.run_local_server(port=0)
+    if not creds:
+        flow = InstalledAppFlow.from_client_secrets_file(
+            "credentials.json", SCOPES
+        )
+        creds = flow.run_local_server(port=0)
         
         with open(token_file, "w") as token:
             token.write(creds.to_json())
+        seed_token_cache(creds)
     
     try:
-        service = build("gmail", "v1", credentials=creds)
+        service = build_gmail_client(creds)
         return service
     except HttpError as error:
         print(f"An error occurred: {error}")
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture
+def whitespace_tokenizer(monkeypatch):
+    """Counts tokens by whitespace, so token budgets are predictable and no tokenizer is downloaded."""
+    from llama_index.core import Settings
+    monkeypatch.setattr(Settings, "tokenizer", str.split)
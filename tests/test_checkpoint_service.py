@@ -0,0 +1,12 @@
+from src.checkpoint_service import checkpoint_config
+
+
+def test_runs_are_keyed_by_thread_and_message():
+    assert checkpoint_config("t1", "m1") == {"configurable": {"thread_id": "t1:m1"}}
+
+
+def test_jobs_without_a_message_id_do_not_share_checkpoints():
+    first = checkpoint_config("t1", None)["configurable"]["thread_id"]
+    second = checkpoint_config("t1", None)["configurable"]["thread_id"]
+    assert first != second
+    assert "None" not in first
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from google.oauth2.credentials import Credentials
+from src.credentials_service import (
+    FileTokenCache, GmailCredentialsManager, PostgresTokenCache, _cache_key, seed_token_cache,
+)
+
+TOKEN_INFO = {"refresh_token": "refresh-1", "client_id": "client", "client_secret": "secret"}
+SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+
+
+def expires_in(seconds):
+    return datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FileTokenCache(str(tmp_path / "tokens.json"))
+
+
+@pytest.fixture
+def google_refreshes(monkeypatch):
+    """Replaces the call to Google with one that issues 'token-N', valid for an hour."""
+    refreshes = []
+
+    def refresh(self, request):
+        refreshes.append(self)
+        self.token = f"token-{len(refreshes)}"
+        self.expiry = expires_in(3600).replace(tzinfo=None)
+
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    return refreshes
+
+
+def test_file_cache_round_trip(cache):
+    expiry = expires_in(600)
+    assert cache.load("k") is None
+
+    cache.update("k", lambda current: {"token": "abc", "expiry": expiry})
+
+    assert cache.load("k") == {"token": "abc", "expiry": expiry}
+
+
+def test_file_cache_update_sees_current_entry_and_can_keep_it(cache):
+    expiry = expires_in(600)
+    cache.update("k", lambda current: {"token": "abc", "expiry": expiry})
+    seen = []
+
+    def keep(current):
+        seen.append(current)
+        return current
+
+    assert cache.update("k", keep) == {"token": "abc", "expiry": expiry}
+    assert seen == [{"token": "abc", "expiry": expiry}]
+
+
+def test_fresh_cached_token_is_reused_without_refreshing(cache, google_refreshes):
+    cache.update(_cache_key("refresh-1"), lambda current: {"token": "shared", "expiry": expires_in(3600)})
+    manager = GmailCredentialsManager(TOKEN_INFO, SCOPES, cache, refresh_margin=300, background=False)
+
+    assert manager.get_credentials().token == "shared"
+    assert google_refreshes == []
+
+
+def test_token_inside_refresh_margin_is_refreshed_and_shared(cache, google_refreshes):
+    cache.update(_cache_key("refresh-1"), lambda current: {"token": "old", "expiry": expires_in(120)})
+    manager = GmailCredentialsManager(TOKEN_INFO, SCOPES, cache, refresh_margin=300, background=False)
+
+    assert manager.get_credentials().token == "token-1"
+    assert cache.load(_cache_key("refresh-1"))["token"] == "token-1"
+
+    # a second container picks up the refreshed token instead of refreshing again
+    other = GmailCredentialsManager(TOKEN_INFO, SCOPES, cache, refresh_margin=300, background=False)
+    assert other.get_credentials().token == "token-1"
+    assert len(google_refreshes) == 1
+
+
+def test_background_refresh_is_scheduled_before_the_margin(cache, google_refreshes):
+    cache.update(_cache_key("refresh-1"), lambda current: {"token": "shared", "expiry": expires_in(3600)})
+    manager = GmailCredentialsManager(TOKEN_INFO, SCOPES, cache, refresh_margin=300, background=True)
+    try:
+        manager.get_credentials()
+        assert manager._timer is not None
+        assert 3290 <= manager._timer.interval <= 3300
+    finally:
+        manager._timer.cancel()
+
+
+def test_seed_token_cache_stores_the_issued_token(cache):
+    creds = Credentials(token="issued", refresh_token="refresh-1", expiry=expires_in(3600).replace(tzinfo=None))
+
+    seed_token_cache(creds, cache)
+
+    assert cache.load(_cache_key("refresh-1"))["token"] == "issued"
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.committed = self.rolled_back = self.closed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return None
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_postgres_cache_rolls_back_and_releases_the_lock_when_refresh_fails():
+    conn = FakeConnection()
+    cache = PostgresTokenCache.__new__(PostgresTokenCache)
+    cache._connect = lambda: conn
+
+    def failing_refresh(current):
+        raise RuntimeError("invalid_grant")
+
+    with pytest.raises(RuntimeError):
+        cache.update("k", failing_refresh)
+
+    assert "pg_advisory_xact_lock" in conn.statements[0]
+    assert conn.rolled_back and conn.closed and not conn.committed
@@ -0,0 +1,67 @@
+from src.grounding import grounding_confidence, grounding_check_node
+
+CONTEXT = (
+    "To apply for the Temporary Graduate visa (subclass 485) you must be 35 years old or younger "
+    "at the time of application. The Post-Higher Education Work stream lets graduates stay for "
+    "2 years after completing a bachelor degree. The base application charge is $1,900 AUD."
+)
+
+
+def _draft(body):
+    return f"<final_answer>Hi Sam,\n\n{body}\n\nKind regards</final_answer>"
+
+
+def test_grounded_draft_scores_high():
+    draft = _draft("You must be 35 years old or younger at the time of application. "
+                   "The Post-Higher Education Work stream lets graduates stay for 2 years.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) >= 0.8
+
+
+def test_changed_age_is_not_confident():
+    draft = _draft("You must be 40 years old or younger at the time of application.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) == 0.0
+
+
+def test_changed_duration_is_not_confident():
+    draft = _draft("The Post-Higher Education Work stream lets graduates stay for 10 years.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) == 0.0
+
+
+def test_changed_unit_is_not_confident():
+    draft = _draft("The Post-Higher Education Work stream lets graduates stay for 2 months.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) == 0.0
+
+
+def test_changed_fee_is_not_confident():
+    draft = _draft("The base application charge for this visa is $1,500 AUD.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) == 0.0
+
+
+def test_fee_formatting_does_not_matter():
+    draft = _draft("The base application charge for this visa is $1900 AUD.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) > 0.0
+
+
+def test_uncertain_draft_is_not_confident():
+    draft = _draft("You might need to be 35 years old or younger at the time of application.")
+    assert grounding_confidence(draft, CONTEXT, [0.9]) == 0.0
+
+
+def test_changed_number_is_sent_to_review():
+    state = {
+        "drafted_answer": _draft("You must be 40 years old or younger at the time of application."),
+        "context_str": CONTEXT,
+        "retrieval_scores": [0.9],
+    }
+    result = grounding_check_node(state, threshold=0.8, audit_rate=0.0)
+    assert "final_decision" not in result
+
+
+def test_grounded_draft_skips_review():
+    state = {
+        "drafted_answer": _draft("You must be 35 years old or younger at the time of application."),
+        "context_str": CONTEXT,
+        "retrieval_scores": [0.9],
+    }
+    result = grounding_check_node(state, threshold=0.8, audit_rate=0.0)
+    assert result["final_decision"]["decision"] == "send"
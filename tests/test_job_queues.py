@@ -0,0 +1,72 @@
+import os
+
+from src.job_queues import FileJobQueue, LocalJobQueue
+
+
+def make_file_queue(tmp_path, max_attempts=3):
+    return FileJobQueue(str(tmp_path), wait_seconds=0, poll_interval=0.01, max_attempts=max_attempts)
+
+
+def test_file_queue_round_trip_keeps_order(tmp_path):
+    job_queue = make_file_queue(tmp_path)
+    job_queue.put({"thread_id": "a"})
+    job_queue.put({"thread_id": "b"})
+
+    batch = job_queue.receive(10)
+
+    assert [job for _, job in batch] == [{"thread_id": "a"}, {"thread_id": "b"}]
+    assert job_queue.receive(10) == []  # claimed jobs are in flight, not pending
+    for receipt, _ in batch:
+        job_queue.ack(receipt)
+    assert os.listdir(job_queue.inflight_dir) == []
+    assert os.listdir(job_queue.pending_dir) == []
+
+
+def test_file_queue_nack_returns_job_to_pending(tmp_path):
+    job_queue = make_file_queue(tmp_path)
+    job_queue.put({"thread_id": "a"})
+
+    [(receipt, _)] = job_queue.receive(1)
+    job_queue.nack(receipt)
+
+    assert [job for _, job in job_queue.receive(1)] == [{"thread_id": "a"}]
+
+
+def test_file_queue_dead_letters_after_max_attempts(tmp_path):
+    job_queue = make_file_queue(tmp_path, max_attempts=2)
+    job_queue.put({"thread_id": "a"})
+
+    for _ in range(2):
+        [(receipt, _)] = job_queue.receive(1)
+        job_queue.nack(receipt)
+
+    assert job_queue.receive(1) == []
+    assert os.listdir(job_queue.inflight_dir) == []
+    assert len(os.listdir(job_queue.failed_dir)) == 1
+
+
+def test_file_queue_ignores_partly_written_jobs(tmp_path):
+    job_queue = make_file_queue(tmp_path)
+    with open(os.path.join(job_queue.pending_dir, "job.json.tmp"), "w") as f:
+        f.write('{"job": ')
+
+    assert job_queue.receive(1) == []
+
+
+def test_local_queue_round_trip_and_dead_letter():
+    job_queue = LocalJobQueue(wait_seconds=0.01, max_attempts=2)
+    job_queue.put({"thread_id": "a"})
+    job_queue.put({"thread_id": "b"})
+
+    batch = job_queue.receive(10)
+    assert [job for _, job in batch] == [{"thread_id": "a"}, {"thread_id": "b"}]
+
+    (receipt_a, _), (receipt_b, _) = batch
+    job_queue.ack(receipt_b)
+    job_queue.nack(receipt_a)
+    [(receipt_a, job)] = job_queue.receive(10)
+    assert job == {"thread_id": "a"}
+
+    job_queue.nack(receipt_a)
+    assert job_queue.empty()
+    assert job_queue.failed == [{"thread_id": "a"}]
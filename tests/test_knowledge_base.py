@@ -0,0 +1,49 @@
+import math
+import pytest
+from src import knowledge_base
+
+chromadb = pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def chroma_client(monkeypatch):
+    client = chromadb.EphemeralClient()
+    for name in ("kb_cosine", "kb_l2"):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    monkeypatch.setattr(knowledge_base, "_chroma_client", client)
+    return client
+
+
+def test_collections_are_created_in_cosine_space(chroma_client):
+    collection = knowledge_base._get_cosine_collection("kb_cosine")
+
+    assert collection.metadata["hnsw:space"] == "cosine"
+
+
+def test_l2_collection_is_recreated_in_cosine_space(chroma_client):
+    old = chroma_client.create_collection("kb_l2")
+    old.add(ids=["a"], embeddings=[[1.0, 0.0]], documents=["a"])
+
+    collection = knowledge_base._get_cosine_collection("kb_l2")
+
+    assert collection.metadata["hnsw:space"] == "cosine"
+    assert collection.count() == 0  # emptied, so load_index ingests it again
+
+
+def test_chroma_scores_become_cosine_similarities(chroma_client):
+    collection = knowledge_base._get_cosine_collection("kb_cosine")
+    collection.add(ids=["a"], embeddings=[[1.0, 0.0]], documents=["a"])
+    distance = collection.query(query_embeddings=[[1.0, 1.0]], n_results=1)["distances"][0][0]
+
+    # llama-index's ChromaVectorStore reports exp(-distance) as the node score
+    similarity = knowledge_base.cosine_similarity(math.exp(-distance), backend="chroma")
+
+    assert similarity == pytest.approx(1 / math.sqrt(2), abs=1e-4)
+
+
+def test_memmap_scores_are_already_cosine():
+    assert knowledge_base.cosine_similarity(0.42, backend="memmap") == 0.42
+    assert knowledge_base.cosine_similarity(None, backend="chroma") is None
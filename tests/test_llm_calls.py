@@ -0,0 +1,87 @@
+import time
+import pytest
+from src import llm_calls
+from src.llm_calls import DeadlineExceeded, LatencyTracker, complete_with_deadline
+from src.agents.manager_agent import manager_agent_node
+
+
+class ScriptedLLM:
+    """Plays one scripted (delay, result) step per call; a result that is an exception is raised."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = 0
+
+    def complete(self, prompt):
+        delay, result = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = LatencyTracker(min_samples=5)
+    monkeypatch.setattr(llm_calls, "latency_tracker", tracker)
+    return tracker
+
+
+def _warm(tracker, node_name, seconds, samples=5):
+    for _ in range(samples):
+        tracker.record(node_name, seconds)
+
+
+def test_p95_uses_default_until_enough_samples(tracker):
+    assert tracker.p95("node", default=7.0) == 7.0
+    for seconds in (0.1, 0.2, 0.3, 0.4, 1.0):
+        tracker.record("node", seconds)
+    assert tracker.p95("node") == 1.0
+
+
+def test_fast_call_does_not_hedge(tracker):
+    _warm(tracker, "node", 0.5)
+    llm = ScriptedLLM((0.0, "answer"))
+    assert complete_with_deadline("prompt", "node", deadline=2.0, hedge=True, llm=llm) == "answer"
+    assert llm.calls == 1
+
+
+def test_hedge_fires_after_p95_and_first_result_wins(tracker):
+    _warm(tracker, "node", 0.05)
+    llm = ScriptedLLM((1.0, "slow primary"), (0.0, "hedge"))
+    start = time.monotonic()
+    assert complete_with_deadline("prompt", "node", deadline=2.0, hedge=True, llm=llm) == "hedge"
+    assert llm.calls == 2
+    assert time.monotonic() - start < 0.5
+
+
+def test_deadline_raises_deadline_exceeded(tracker):
+    llm = ScriptedLLM((1.0, "too late"))
+    with pytest.raises(DeadlineExceeded) as raised:
+        complete_with_deadline("prompt", "node", deadline=0.1, llm=llm)
+    assert raised.value.node_name == "node"
+
+
+def test_losing_failure_does_not_mask_the_winner(tracker):
+    _warm(tracker, "node", 0.05)
+    llm = ScriptedLLM((0.2, RuntimeError("primary failed")), (0.3, "hedge"))
+    assert complete_with_deadline("prompt", "node", deadline=2.0, hedge=True, llm=llm) == "hedge"
+
+
+def test_error_propagates_when_every_attempt_fails(tracker):
+    _warm(tracker, "node", 0.05)
+    llm = ScriptedLLM((0.2, RuntimeError("primary failed")), (0.0, RuntimeError("hedge failed")))
+    with pytest.raises(RuntimeError):
+        complete_with_deadline("prompt", "node", deadline=2.0, hedge=True, llm=llm)
+
+
+def test_manager_deadline_escalates(tracker, whitespace_tokenizer):
+    class SlowRouter:
+        def complete(self, prompt, node_name, state, deadline=None, hedge=False):
+            return "light", complete_with_deadline(prompt, node_name, deadline=deadline, hedge=hedge, llm=ScriptedLLM((1.0, "{}")))
+
+    state = {"question": "Can I work?", "context_str": "Yes.", "drafted_answer": "You can work."}
+    result = manager_agent_node(state, deadline=0.1, router=SlowRouter())
+    assert result["final_decision"]["decision"] == "escalate"
+    assert result["deadline_exceeded"] == "manager_agent"
@@ -0,0 +1,74 @@
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import (
+    FilterCondition, FilterOperator, MetadataFilter, MetadataFilters, VectorStoreQuery,
+)
+from src.memmap_vector_store import MemmapVectorStore
+
+
+def _node(node_id, doc_id, embedding, **metadata):
+    return TextNode(
+        id_=node_id,
+        text=f"text of {node_id}",
+        embedding=embedding,
+        metadata=metadata,
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+    )
+
+
+def _store(tmp_path):
+    store = MemmapVectorStore(persist_dir=str(tmp_path))
+    store.add([
+        _node("a", "doc1", [1.0, 0.0], section="eligibility", year=2024),
+        _node("b", "doc1", [0.6, 0.8], section="fees", year=2025),
+        _node("c", "doc2", [0.0, 2.0], section="fees", year=2023),
+    ])
+    return store
+
+
+def _query(store, embedding, k=3, **kwargs):
+    return store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=k, **kwargs))
+
+
+def test_query_returns_top_k_by_cosine_similarity(tmp_path):
+    result = _query(_store(tmp_path), [1.0, 0.0], k=2)
+    assert result.ids == ["a", "b"]
+    assert [round(score, 3) for score in result.similarities] == [1.0, 0.6]
+    assert result.nodes[0].get_content() == "text of a"
+
+
+def test_store_reloads_from_disk(tmp_path):
+    _store(tmp_path)
+    reloaded = MemmapVectorStore(persist_dir=str(tmp_path))
+    assert reloaded.count() == 3
+    assert _query(reloaded, [0.0, 1.0], k=1).ids == ["c"]
+
+
+def test_delete_removes_a_documents_nodes_and_persists(tmp_path):
+    store = _store(tmp_path)
+    store.delete("doc1")
+    assert store.count() == 1
+    assert _query(MemmapVectorStore(persist_dir=str(tmp_path)), [1.0, 0.0]).ids == ["c"]
+
+
+def test_exact_match_filter(tmp_path):
+    filters = MetadataFilters(filters=[MetadataFilter(key="section", value="fees")])
+    assert _query(_store(tmp_path), [1.0, 0.0], filters=filters).ids == ["b", "c"]
+
+
+def test_combined_and_or_filters(tmp_path):
+    store = _store(tmp_path)
+    both = MetadataFilters(filters=[
+        MetadataFilter(key="section", value="fees"),
+        MetadataFilter(key="year", value=2024, operator=FilterOperator.GTE),
+    ])
+    assert _query(store, [1.0, 0.0], filters=both).ids == ["b"]
+
+    either = MetadataFilters(condition=FilterCondition.OR, filters=[
+        MetadataFilter(key="section", value="eligibility"),
+        MetadataFilter(key="year", value=[2023], operator=FilterOperator.IN),
+    ])
+    assert _query(store, [1.0, 0.0], filters=either).ids == ["a", "c"]
+
+
+def test_doc_id_restriction(tmp_path):
+    assert _query(_store(tmp_path), [1.0, 0.0], doc_ids=["doc2"]).ids == ["c"]
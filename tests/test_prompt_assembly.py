@@ -0,0 +1,48 @@
+import pytest
+from src.prompt_assembly import dedupe_chunks, fit_to_budget, select_supporting_chunks
+
+pytestmark = pytest.mark.usefixtures("whitespace_tokenizer")
+
+LONG_CHUNK = " ".join(f"word{i}" for i in range(700))
+
+
+def test_dedupe_drops_chunks_covered_by_a_higher_ranked_one():
+    first = "The visa lets graduates work full time in Australia for two years."
+    overlapping = "The visa lets graduates work full time in Australia for two years after study."
+    other = "Applicants must hold health insurance for the whole stay."
+    assert dedupe_chunks([first, overlapping, other]) == [first, other]
+
+
+def test_dedupe_keeps_distinct_chunks_and_drops_empty_ones():
+    assert dedupe_chunks(["alpha beta gamma", "", "delta epsilon zeta"]) == ["alpha beta gamma", "delta epsilon zeta"]
+
+
+def test_fit_keeps_chunks_within_budget():
+    assert fit_to_budget(["one two", "three four"], 10) == ["one two", "three four"]
+
+
+def test_fit_cuts_overflowing_chunk_to_whole_sentences():
+    chunks = ["one two three", "Four five. Six seven eight. Nine."]
+    assert fit_to_budget(chunks, 6) == ["one two three", "Four five."]
+
+
+def test_fit_drops_everything_after_the_overflowing_chunk():
+    chunks = ["one two three", "a b c d e f g h", "x y"]
+    assert fit_to_budget(chunks, 4) == ["one two three"]
+
+
+def test_fit_truncates_top_chunk_with_no_sentence_that_fits():
+    fitted = fit_to_budget([LONG_CHUNK, "short lower ranked chunk"], 50)
+    assert fitted == [" ".join(LONG_CHUNK.split()[:50])]
+
+
+def test_supporting_chunks_keep_a_long_chunk_the_draft_quotes():
+    quoted = " ".join(LONG_CHUNK.split()[100:125])
+    chance = "the applicant must apply before the deadline"
+    draft = f"Hi Sam, {quoted}. Regards"
+    assert select_supporting_chunks([LONG_CHUNK, chance], draft) == [LONG_CHUNK]
+
+
+def test_supporting_chunks_fall_back_to_all_chunks():
+    chunks = ["alpha beta gamma delta", "epsilon zeta eta theta"]
+    assert select_supporting_chunks(chunks, "nothing in common here at all") == chunks
@@ -0,0 +1,172 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+import threading
+from llama_index.core.base.llms.types import CompletionResponse
+from src import prompt_cache
+from src.prompt_cache import (
+    CACHE_REFRESH_MARGIN_SECONDS, CacheUnavailable, FakeCacheProvider, LocalCacheRegistry, PromptCache,
+)
+from src.prompt_templates import SplitPrompt
+
+# the fake provider counts tokens by whitespace, and so does the tokenizer fixture
+pytestmark = pytest.mark.usefixtures("whitespace_tokenizer")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingLLM:
+    """Stands in for the uncached model and remembers what it was sent."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return CompletionResponse(text="uncached")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(prompt_cache.time, "monotonic", clock)
+    monkeypatch.setattr(prompt_cache.time, "time", clock)
+    return clock
+
+
+def test_cached_prefix_is_reused_and_tokens_are_counted(clock):
+    provider = FakeCacheProvider(responder=lambda prompt: "cached")
+    cache = PromptCache(provider, ttl_seconds=3600)
+    prompt = SplitPrompt("one two three ", "four five")
+
+    assert cache.complete("model", prompt, RecordingLLM()).text == "cached"
+    assert cache.complete("model", prompt, RecordingLLM()).text == "cached"
+
+    assert provider.created == 1
+    stats = cache.stats()
+    assert stats["cached_input_tokens"] == 6
+    assert stats["uncached_input_tokens"] == 4
+
+
+def test_cache_is_replaced_before_its_ttl_runs_out(clock):
+    provider = FakeCacheProvider()
+    cache = PromptCache(provider, ttl_seconds=3600)
+    prompt = SplitPrompt("static prefix ", "question")
+
+    cache.complete("model", prompt, RecordingLLM())
+    first = next(iter(provider.caches))
+    clock.now += 3600 - CACHE_REFRESH_MARGIN_SECONDS
+    cache.complete("model", prompt, RecordingLLM())
+
+    assert provider.created == 2
+    # the old cache is left to expire, since other containers may still use it
+    assert first in provider.caches
+    assert cache.stats()["caches_created"] == 2
+
+
+def test_containers_sharing_a_registry_reuse_one_cache(clock):
+    provider = FakeCacheProvider()
+    registry = LocalCacheRegistry()
+    first = PromptCache(provider, registry=registry)
+    second = PromptCache(provider, registry=registry)
+    prompt = SplitPrompt("static prefix ", "question")
+
+    first.complete("model", prompt, RecordingLLM())
+    second.complete("model", prompt, RecordingLLM())
+
+    assert provider.created == 1
+    assert "caches_created" not in second.stats()
+
+
+def test_cache_creation_does_not_block_other_prefixes():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowProvider(FakeCacheProvider):
+        def create_cache(self, model, prefix, ttl_seconds):
+            if prefix.startswith("slow"):
+                started.set()
+                release.wait(timeout=5)
+            return super().create_cache(model, prefix, ttl_seconds)
+
+    cache = PromptCache(SlowProvider())
+    slow = threading.Thread(target=cache.complete, args=("model", SplitPrompt("slow prefix ", "q"), RecordingLLM()))
+    slow.start()
+    try:
+        assert started.wait(timeout=5)
+        # completes while the other prefix's cache is still being created
+        cache.complete("model", SplitPrompt("fast prefix ", "q"), RecordingLLM())
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
+    assert cache.stats()["caches_created"] == 2
+
+
+def test_concurrent_calls_for_one_prefix_create_one_cache():
+    release = threading.Event()
+
+    class SlowProvider(FakeCacheProvider):
+        def create_cache(self, model, prefix, ttl_seconds):
+            release.wait(timeout=5)
+            return super().create_cache(model, prefix, ttl_seconds)
+
+    provider = SlowProvider()
+    cache = PromptCache(provider)
+    prompt = SplitPrompt("static prefix ", "question")
+    threads = [threading.Thread(target=cache.complete, args=("model", prompt, RecordingLLM())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert provider.created == 1
+
+
+def test_prefix_below_the_minimum_is_sent_uncached(clock):
+    cache = PromptCache(FakeCacheProvider(min_prefix_tokens=100))
+    llm = RecordingLLM()
+    prompt = SplitPrompt("short prefix ", "question")
+
+    assert cache.complete("model", prompt, llm).text == "uncached"
+    assert llm.prompts == ["short prefix question"]
+    stats = cache.stats()
+    assert stats["not_cached"] == 1
+    assert stats["uncached_input_tokens"] == 3
+    assert "cached_input_tokens" not in stats or stats["cached_input_tokens"] == 0
+
+
+def test_failed_cache_creation_falls_back_and_pauses_the_model(clock):
+    class FailingProvider(FakeCacheProvider):
+        def create_cache(self, model, prefix, ttl_seconds):
+            raise CacheUnavailable("quota")
+
+    cache = PromptCache(FailingProvider())
+    llm = RecordingLLM()
+    prompt = SplitPrompt("library prefix ", "question", fallback="plain question")
+
+    assert cache.complete("model", prompt, llm).text == "uncached"
+    assert llm.prompts == ["plain question"]
+    assert cache.stats()["fallbacks"] == 1
+    assert not cache.will_cache("model", prompt.prefix)
+    assert cache.will_cache("other-model", prompt.prefix)
+
+
+def test_failed_generation_sends_the_fallback_prompt(clock):
+    def fail(prompt):
+        raise RuntimeError("timeout")
+
+    cache = PromptCache(FakeCacheProvider(responder=fail))
+    llm = RecordingLLM()
+    prompt = SplitPrompt("library prefix ", "question", fallback="plain question")
+
+    cache.complete("model", prompt, llm)
+    assert llm.prompts == ["plain question"]
+    assert cache.stats()["uncached_input_tokens"] == 2
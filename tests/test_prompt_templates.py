@@ -0,0 +1,46 @@
+import pytest
+from src import prompt_templates
+from src.prompt_templates import HotChunkTracker, build_split_prompt, reference_library_chunks, split_template
+
+TEMPLATE = "You are a helpful agent.\nFollow the rules.\n\nQuestion: {query_str}\nContext: {context_str}\n"
+
+
+def test_customer_template_keeps_placeholders_out_of_the_prefix():
+    with open("./src/agents/customer_prompt.md", "r") as f:
+        template = f.read()
+    prefix, suffix = split_template(template)
+    assert prefix and suffix
+    assert prefix + suffix == template
+    assert not prompt_templates._PLACEHOLDER.search(prefix)
+    assert prompt_templates._PLACEHOLDER.search(suffix)
+
+
+def test_prefix_is_identical_across_variables():
+    first = build_split_prompt(TEMPLATE, query_str="Can I work?", context_str="A")
+    second = build_split_prompt(TEMPLATE, query_str="How long?", context_str="B")
+    assert first.prefix == second.prefix
+    assert "How long?" in second.suffix and "{" not in second.suffix
+
+
+def test_library_goes_into_the_prefix():
+    prompt = build_split_prompt(TEMPLATE, library_chunks=["chunk one"], fallback="plain", query_str="q", context_str="c")
+    assert "<knowledge_library>" in prompt.prefix and "[K1]\nchunk one" in prompt.prefix
+    assert prompt.fallback == "plain"
+
+
+def test_library_chunks_are_referenced_instead_of_repeated():
+    assert reference_library_chunks(["a", "b"], ["b"]) == ["a", "[K1] (see <knowledge_library>)"]
+
+
+def test_hot_chunks_respect_the_token_budget():
+    tracker = HotChunkTracker(min_hits=1, count_tokens=lambda text: len(text.split()))
+    tracker.record("485", ["a b c", "d e f g"])
+    assert tracker.hot_chunks("485") == ["a b c", "d e f g"]
+    assert tracker.hot_chunks("485", max_tokens=4) == ["a b c"]
+
+
+def test_hot_chunks_need_min_hits():
+    tracker = HotChunkTracker(min_hits=2)
+    tracker.record("485", ["a", "b"])
+    tracker.record("485", ["a"])
+    assert tracker.hot_chunks("485") == ["a"]
@@ -0,0 +1,63 @@
+import pytest
+
+import worker
+from src.job_queues import LocalJobQueue
+
+
+@pytest.fixture
+def run_worker(monkeypatch):
+    """Runs a worker over a local queue until it drains, with process_job replaced by the given function."""
+    def run(jobs, process_job, concurrency=2, max_attempts=3):
+        monkeypatch.setattr(worker, "process_job", process_job)
+        job_queue = LocalJobQueue(wait_seconds=0.05, max_attempts=max_attempts)
+        for job in jobs:
+            job_queue.put(job)
+        agent_worker = worker.Worker(
+            job_queue, concurrency, exit_when_empty=True, app_factory=lambda checkpointer, router: object()
+        )
+        agent_worker.run()
+        return agent_worker, job_queue
+    return run
+
+
+def test_worker_drains_the_queue_and_exits(run_worker):
+    jobs = [{"thread_id": f"thread-{i}", "id": f"m{i}"} for i in range(5)]
+    processed = []
+
+    def process_job(app, job, checkpointer=None):
+        processed.append(job["id"])
+        return {}
+
+    agent_worker, job_queue = run_worker(jobs, process_job)
+
+    assert sorted(processed) == ["m0", "m1", "m2", "m3", "m4"]
+    assert agent_worker.stats.processed == 5
+    assert job_queue.empty()
+
+
+def test_failing_job_is_dead_lettered_and_worker_exits(run_worker):
+    calls = []
+
+    def process_job(app, job, checkpointer=None):
+        calls.append(job["id"])
+        raise RuntimeError("boom")
+
+    agent_worker, job_queue = run_worker([{"thread_id": "t", "id": "m1"}], process_job, max_attempts=3)
+
+    assert calls == ["m1", "m1", "m1"]
+    assert agent_worker.stats.failed == 3
+    assert job_queue.failed == [{"thread_id": "t", "id": "m1"}]
+
+
+def test_superseded_jobs_in_a_batch_are_skipped(run_worker):
+    jobs = [{"thread_id": "t", "id": "m1"}, {"thread_id": "t", "id": "m2"}]
+    processed = []
+
+    def process_job(app, job, checkpointer=None):
+        processed.append(job["id"])
+        return {}
+
+    agent_worker, _ = run_worker(jobs, process_job)
+
+    assert processed == ["m2"]
+    assert agent_worker.stats.skipped == 1
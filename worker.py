@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.database_service import setup_database
+from src.coalescing import latest_job_per_thread
+from src.checkpoint_service import get_checkpointer, prune_checkpoints
+from src.job_processor import process_job
+from src.job_queues import SQSJobQueue, FileJobQueue, LocalJobQueue
+from src.model_router import ModelRouter
+from src.llm_calls import size_llm_pool
+from src.prompt_cache import PromptCache, GeminiCacheProvider, get_cache_registry
+
+
+class WorkerStats:
+    """Counts finished jobs and their latencies so a run can be used as a benchmark."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, outcome, seconds=None):
+        """Records a finished job as 'processed', 'skipped' or 'failed'."""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if seconds is not None:
+                self.latencies.append(seconds)
+
+    def summary(self):
+        """Returns a one-line summary of throughput and latency so far."""
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            latencies = sorted(self.latencies)
+            finished = self.processed + self.skipped + self.failed
+        if not latencies:
+            return f"{finished} job(s) in {elapsed:.1f}s."
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (
+            f"{finished} job(s) in {elapsed:.1f}s ({finished / elapsed:.2f}/s): "
+            f"{self.processed} processed, {self.skipped} coalesced, {self.failed} failed. "
+            f"Latency p50 {p50:.2f}s, p95 {p95:.2f}s."
+        )
+
+
+class Worker:
+    """
+    Processes agent jobs from a queue with a fixed pool of concurrent workers.
+
+    The queue is only polled for as many jobs as there are idle workers, so a
+    slow backlog stays in the queue instead of piling up in memory. On SIGINT
+    or SIGTERM the worker stops polling, lets in-flight jobs finish and exits.
+
+    Every worker thread gets its own compiled graph and Gmail client, because
+    Google API clients are not thread-safe. The knowledge base indexes, LLM
+    clients, model router, prompt cache and database checkpointer are shared across all of them.
+
+    A job that fails is returned to the queue, which dead-letters it after a
+    few attempts, so a job that always fails cannot keep the worker busy.
+
+    Args:
+        app_factory (callable, optional): Builds one thread's compiled graph from
+                                          the checkpointer and router. Defaults
+                                          to build_graph with a fresh Gmail client.
+    """
+
+    def __init__(self, job_queue, concurrency, checkpointer=None, exit_when_empty=False, app_factory=None):
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.checkpointer = checkpointer
+        self.exit_when_empty = exit_when_empty
+        self.stats = WorkerStats()
+        self._stop = threading.Event()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._local = threading.local()
+        self.app_factory = app_factory or _build_thread_app
+        size_llm_pool(concurrency)
+        # one router for all threads, so its routing stats cover the whole worker
+        self.router = ModelRouter(prompt_cache=PromptCache(GeminiCacheProvider(), registry=get_cache_registry()))
+
+    def stop(self, *_):
+        """Asks the worker to stop after its in-flight jobs finish."""
+        if not self._stop.is_set():
+            print("🛑 Shutdown requested. Finishing in-flight jobs...")
+        self._stop.set()
+
+    def _get_app(self):
+        """Returns this thread's compiled graph, building it on first use."""
+        if not hasattr(self._local, "app"):
+            self._local.app = self.app_factory(self.checkpointer, self.router)
+        return self._local.app
+
+    def _run_job(self, receipt, job):
+        """Processes one job and acknowledges it, or returns it to the queue on failure."""
+        start = time.monotonic()
+        try:
+            final_state = process_job(self._get_app(), job, self.checkpointer)
+            self.job_queue.ack(receipt)
+            self.stats.record("processed" if final_state is not None else "skipped", time.monotonic() - start)
+        except Exception as e:
+            print(f"❌ An error occurred processing a message: {e}")
+            self.job_queue.nack(receipt)
+            self.stats.record("failed")
+        finally:
+            self._slots.release()
+
+    def _acquire_free_slots(self):
+        """Blocks until at least one worker is idle, then claims every idle worker."""
+        while not self._slots.acquire(timeout=1):
+            if self._stop.is_set():
+                return 0
+        free = 1
+        while free < self.concurrency and self._slots.acquire(blocking=False):
+            free += 1
+        return free
+
+    def run(self):
+        """Polls the queue and dispatches jobs until stopped."""
+        print(f"👷 Worker started with {self.concurrency} concurrent job(s).")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="agent-worker") as pool:
+            while not self._stop.is_set():
+                free = self._acquire_free_slots()
+                if not free:
+                    break
+
+                batch = self.job_queue.receive(free)
+
+                # jobs superseded by a newer job for the same thread are acknowledged unprocessed
+                latest = latest_job_per_thread([job for _, job in batch])
+                to_run = [(receipt, job) for receipt, job in batch if any(job is kept for kept in latest)]
+                for receipt, job in batch:
+                    if not any(job is kept for kept in latest):
+                        self.job_queue.ack(receipt)
+                        self.stats.record("skipped")
+
+                # hand back the slots this batch did not need
+                for _ in range(free - len(to_run)):
+                    self._slots.release()
+
+                for receipt, job in to_run:
+                    pool.submit(self._run_job, receipt, job)
+
+                if not batch and self.exit_when_empty and free == self.concurrency:
+                    print("📭 Queue is empty. Stopping.")
+                    break
+
+        print(f"📊 {self.stats.summary()}")
+        if self.router.prompt_cache:
+            print(f"💾 Prompt cache: {self.router.prompt_cache.stats()}")
+
+
+def _build_thread_app(checkpointer, router):
+    """Builds the compiled graph for one worker thread, with its own Gmail client."""
+    # imported here because importing src.graph fetches the API key and configures the LLM clients
+    from src.graph import build_graph
+    from src.gmail_service import get_gmail_service
+    return build_graph(gmail_service=get_gmail_service(cached=False), checkpointer=checkpointer, router=router)
+
+
+def _make_queue(args):
+    """Creates the job queue selected on the command line."""
+    if args.queue == "sqs":
+        if not args.queue_url:
+            raise SystemExit("❌ SQS Queue URL not configured. Pass --queue-url or set NEW_QUERY_QUEUE_URL.")
+        return SQSJobQueue(args.queue_url, wait_seconds=args.wait_seconds)
+    if args.queue == "file":
+        return FileJobQueue(args.queue_path, wait_seconds=args.wait_seconds)
+    return LocalJobQueue(wait_seconds=min(args.wait_seconds, 1))
+
+
+def main():
+    """
+    Runs the agent as a long-running worker instead of a per-invocation Lambda.
+
+    Example (local benchmark of 200 jobs with 8 workers):
+        python worker.py --queue local --jobs jobs.jsonl --workers 8 --exit-when-empty
+    """
+    parser = argparse.ArgumentParser(description="Long-running customer agent worker.")
+    parser.add_argument("--queue", choices=["sqs", "file", "local"], default="sqs")
+    parser.add_argument("--queue-url", default=os.getenv("NEW_QUERY_QUEUE_URL"))
+    parser.add_argument("--queue-path", default="./worker_queue", help="Directory used by the file queue.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--wait-seconds", type=int, default=20, help="Long-polling wait per receive.")
+    parser.add_argument("--jobs", help="A JSON-lines file of jobs to enqueue before starting.")
+    parser.add_argument("--exit-when-empty", action="store_true", help="Stop once the queue is drained.")
+    args = parser.parse_args()
+
+    job_queue = _make_queue(args)
+    if args.jobs:
+        with open(args.jobs, "r") as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+        for job in jobs:
+            job_queue.put(job)
+        print(f"📥 Enqueued {len(jobs)} job(s) from {args.jobs}.")
+
+    # --- Global Setup ---
+    print("Worker starting up.")
+    setup_database()
+    checkpointer = get_checkpointer(max_connections=args.workers)
+    prune_checkpoints(checkpointer)
+
+    worker = Worker(job_queue, args.workers, checkpointer=checkpointer, exit_when_empty=args.exit_when_empty)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()